@@ -15,12 +15,12 @@ import os
 import matplotlib.pyplot as plt
 import pandas as pd
 from sklearn.preprocessing import StandardScaler  #pip install scikit-learn
+from sklearn.base import clone
 from datetime import datetime
 import importlib
 import joblib
 
 # Other packages that must be installed prior to running:
-# atmos (for humidity conversion)
 # numpy
 # xlsxwriter
 # seaborn
@@ -32,8 +32,12 @@ print('Beginning "MPC Colocation"')
 from Python_Functions import preprocessing_func
 from Python_Functions import test_train_split_func
 from Python_Functions import data_loading_func
+from Python_Functions import colocation_data
 from Python_Functions import plotting_func
 from Python_Functions import weighting_grid
+from Python_Functions import pod_schemas
+from Python_Functions import colo_model_func
+from Python_Functions import feature_graph
 
 
 #########
@@ -53,9 +57,21 @@ settings['pollutant'] = 'TVOC_ppm' #make sure this matches the column name in th
 settings['unit'] = 'ppm' #concentration units of the target pollutant (for plot labels)
 settings['time_interval'] = 60 #time averaging in minutes. needs to be at least as high as the time resolution of the reference data
 settings['retime_calc'] = "median" #How the time averaging is calculated. Options are median and mean right now and are the same for pod and ref
+settings['alignment'] = 'resample' #how pod and reference data are paired before time averaging. 'resample' averages each over the time_interval. 'asof' pairs each reference time with the nearest pod time (within asof_tolerance) and averages the pairs, for high rate reference data or a time_interval close to the data resolution
+settings['asof_tolerance'] = 60 #if alignment is 'asof', the largest gap in seconds between a reference time and its pod time. Reference times without a pod time that close are left out
+settings['clock_offset'] = 0 #seconds added to the pod times (after the timezone correction) to correct a pod clock that is behind (positive) or ahead (negative) of the reference
+settings['retime_stats'] = [] #extra statistics of each time averaging interval saved to colo_retime_stats.csv, e.g. ['count','std']. Leave empty to skip
 settings['sensors_included'] = ["Fig2600","Fig2602","Temperature","Humidity"] #list the sensors you want in the model (both pollutant and environmental, like temperature or humidity)
 settings['scaler'] = StandardScaler() #How the data is scaled. StandardScaler is mean zero and st dev 1
 settings['t_warmup'] = 120 #warm up period in minutes
+settings['fast_parse'] = True #True reads pod .txt files with the vectorized parser (much faster). False uses the old cell-by-cell float converter
+settings['cache_raw_files'] = True #True saves each parsed pod file in a 'pod_cache' folder next to the data, and reuses it until the file, its header_type or column_names change
+settings['cache_format'] = 'parquet' #format of the cached pod files: 'parquet' (compressed) or 'npy' (memory-mapped binary array, fastest to open for repeated analyses)
+settings['n_workers'] = 1 #number of processes used to import pod files at the same time. 1 imports them one after the other, -1 uses all cores
+settings['chunksize'] = None #None reads each pod file all at once. A number of rows (e.g. 1000000) streams files in chunks and only keeps rows inside the deployment log start/end, for very large SD card dumps
+settings['precision'] = 'float64' #'float64' or 'float32'. float32 keeps pod and feature data in half the memory (also used for harmonization and field data)
+settings['precision_check'] = True #if precision is 'float32', also build the model inputs in float64 and save the change in model output as Precision_RMSE in the model stats (loads the colocation data a second time, unless it is in the pyramid cache)
+settings['pyramid_cache'] = True #True saves the time averaged pod and reference data at 1, 5, 15 and 60 min (and time_interval) in Colocation/pyramid_cache. Reruns with the same files and preprocessing at those intervals skip loading and preprocessing
 settings['test_percentage'] = 0.2 #what percentage of data goes into the test set, usually 0.2 or 0.3
 settings['traintest_split_type'] = 'mid_end_split' #how the data is split into train and test
 #start_end_split takes the % of the data at the start and % of data at the end to form test set
@@ -97,81 +113,21 @@ settings['preprocess'] = ["rmv_warmup",'temp_C_2_K','hum_rel_2_abs']
 #Sub settings for resampling/weighting preprocessing functions
 settings['quartiles_to_resample'] = ['first']   ##which quantiles you want to downsample from if applying 'resample_quartile' in 'preprocess
 settings['quartiles_downsampling_rate'] = 0.6   ## If using 'resample_quartile', choose a downsampling rate between 0-1 (e.g., keeping 70% of instances within the lower quartile)
+settings['resample_seed'] = 42   ## seed for the random selection in binned_resample and resample_quartile, so runs can be repeated. None gives a different selection every run
 settings['n_bins']= 5   ## If using binned_resample, choose how many bins to split the data into.
 settings['binned_resample_binnum_multiplier'] = 2  #The number of samples per bin after resampling is set as 1/n_bins. However, this can be adjusted by mulitiplying 1/n by 'binned_resample_binnum_multiplier' if you don't want to remove so much data
+settings['interaction_pairs'] = None  ## If using interaction_terms, list the sensor pairs to multiply, e.g. [('Fig2600','Temperature'), ('Fig2600','Humidity')]. None uses every pair of columns
+settings['interaction_max_pairs'] = None  ## If using interaction_terms with interaction_pairs = None, a number here only keeps that many pairs (the ones whose product correlates best with the reference). None keeps every pair
 settings['weighting_percentile'] = [99.5,99.9] #list which percentiles to test for weighting. All data points in that percentile or higher will be weighted higher than those below.
 settings['weighting_weight'] = [10, 15, 20] #list what weights to test for a weighted model. All points above the percentile will be given this weight. Those below the percentile will have a weight of 1.
 
 #Column_names is a dictionary of column names lists that will be applied to pod data.
 # The name of the list corresponds to the deployment log "header_type" column
+# The lists for each firmware version are registered in Python_Functions/pod_schemas.py (add new header types there,
+# or add them to this dictionary for a single run)
 # besides datetime (or date and time), ALL columns must be numeric.
 #if you want to have data columns that are strings (text), discuss with caroline.
-settings['column_names'] = {'3.1.0': # latest and greatest firmware update
-                                ["datetime", "Volts", "Fig2600", "Fig2602", "Fig3", "Fig3heater", "Fig4", "Fig4heater",
-                                "PID","Mics2611", "CO_aux","CO_main", "CO2", "Temperature", "Pressure", "Humidity",
-                                "Quad1C1", "Quad1C2", "Quad1C3", "Quad1C4", "Quad2C1", "Quad2C2", "Quad2C3", "Quad2C4",
-                                "MQ131", "PM 10 ENV", "PM 25 ENV", "PM 100 ENV", "PM 03 um", "PM 05 um", "PM 10 um",
-                                "PM 25 um", "PM 50 um", "PM 100 um", "OPC1", "OPC2", "OPC3", "OPC4", "OPC5", "WS_mph", "WD", "unk"],
-
-                            '3.1.1': # fixing apods from 9/2024
-                                ["datetime", "Volts", "Fig2600", "Fig2602", "Fig3", "Fig3heater", "Fig4", "Fig4heater",
-                                "PID","Mics2611", "CO_aux","CO_main", "CO2", "Temperature", "Pressure", "Humidity",
-                                "Quad1C1", "Quad1C2", "Quad1C3", "Quad1C4", "Quad2C1", "Quad2C2", "Quad2C3", "Quad2C4",
-                                "MQ131", "PM 10 ENV", "PM 25 ENV", "PM 100 ENV", "PM 03 um", "PM 05 um", "PM 10 um",
-                                "PM 25 um", "PM 50 um", "PM 100 um", "OPC1", "OPC2", "OPC3", "OPC4", "OPC5", "WS_mph",
-                                "WD", "unk1", "unk2", "unk3", "unk4", "unk5", "unk6", "unk7", "unk8", "unk9", "unk10",
-                                "unk11", "unk12", "unk13", "unk14", "unk15", "unk16", "unk17"],
-
-                            '3.2.0': #MPOD SD card 1/2025
-                                ["datetime", "Fig2600", "Fig2602", "Fig2611", "CO_worker", "CO_aux",
-                                 "Temperature", "Pressure", "Humidity", "Gas_Resistance"],
-
-                            '3.2.1': #MPOD cellular 1/2025
-                                ["ParticleID","datetime", "Fig2600", "Fig2602", "Fig2611", "CO_aux", "CO_worker",
-                                 "Temperature", "Humidity"],
-
-                            '3.1.2': #for APOD5 with updated firmware (XPODV3.1.2) #need to validate # of unknowns
-                                ["datetime", "Volts", "Fig2600", "Fig2602", "Fig3", "Fig3heater", "Fig4", "Fig4heater",
-                                "e2V","PID", "CO_aux","CO_main", "CO2", "Temperature", "Pressure", "Humidity",
-                                "Quad1C1", "Quad1C2", "Quad2C1", "Quad2C2", "Quad3C1", "Quad3C2", "Quad4C1", "Quad4C2",
-                                "MET_spd", "MET_dir", "MQ131", "PM 10 ENV", "PM 25 ENV", "PM 100 ENV", "PM 03 um", "PM 05 um", "PM 10 um",
-                                "PM 25 um", "PM 50 um", "PM 100 um"],
-
-                            '3.0.9': # for C16 September 2023
-                                ["datetime", "Volts", "Fig2600", "Fig2602", "Fig3", "Fig3heater", "Fig4", "Fig4heater",
-                                "PID","Mics2611", "CO_main", "CO2", "Temperature", "Pressure", "Humidity",
-                                "Quad1C1", "Quad1C2", "Quad1C3", "Quad1C4", "Quad2C1", "Quad2C2", "Quad2C3", "Quad2C4",
-                                "MQ131", "PM 10 ENV", "PM 25 ENV", "PM 100 ENV", "PM 03 um", "PM 05 um", "PM 10 um",
-                                "PM 25 um", "PM 50 um", "PM 100 um", "OPC1", "OPC2", "OPC3", "OPC4", "OPC5", "WS_mph", "WD", "unk", "unk1", "unk2"],
-
-                            '3.0.0':
-                                ["datetime", "Volts", "Fig2600", "Fig2602", "Fig3heater", "Fig3", "Fig4heater", "Fig4",
-                                 "e2vO3", "PID", "CO_aux", "CO_main", "CO2", "Temperature", "Pressure", "Humidity",
-                                 "QS1_Aux", "QS1_Main", "QS2_Aux", "QS2_Main", "QS3_Aux", "QS3_Main", "QS4_Aux",
-                                 "QS_Main", "Wind_Dir", "Wind_Spd", "MQ", "PT_PM10ENV", "PT_PM25ENV", "PT_PM100ENV",
-                                 "PT_PM03um", "PT_PM05um", "PT_PM10um", "PT_PM25um", "PT_PM50um", "PT_100um", "OPC_SampPer",
-                                 "OPC_FlowRate", "OPC_PM10", "OPC_PM25", "OPC_PM100"],
-
-                            '3.1.2_opc':
-                                ["datetime", "Volts", "Fig2600", "Fig2602", "Fig3", "Fig3heater", "Fig4", "Fig4heater",
-                                 "PID","Mics2611", "CO_aux", "CO_main", "CO2",
-                                 "Temperature", "Pressure", "Humidity", "QS1_Aux", "QS1_Main", "QS2_Aux", "QS2_Main",
-                                 "QS3_Aux", "QS3_Main", "QS4_Aux", "QS4_Main", 'WS_mph', 'WD',
-                                 "MQ131", "PM 10 ENV", "PM 25 ENV", "PM 100 ENV", "PM 03 um", "PM 05 um", "PM 10 um",
-                                 "PM 25 um", "PM 50 um", "PM 100 um", 'OPC_Bin1_', 'OPC_Bin2', 'OPC_Bin3', 'OPC_Bin4',
-                                 'OPC_Bin5', 'OPC_Bin6', 'OPC_Bin7', 'OPC_Bin8',
-                                 'OPC_Bin9', 'OPC_Bin10', 'OPC_Bin11', 'OPC_Bin12', 'OPC_Bin13', 'OPC_Bin14',
-                                 'OPC_Bin15', 'OPC_Bin16', 'OPC_SampPer',
-                                 'OPC_FlowRate', 'OPC_PM10_', 'OPC_PM25', 'OPC_PM100', 'unk'],
-
-                            '3.1.2_not using':
-                                ["datetime","Volts", "Fig2600", "Fig2602","Fig3","Fig3heater", "Fig4","Fig4heater",
-                                "PID", "Mics2611", "CO_aux","CO_main", "CO2", "Temperature", "Pressure", "Humidity", "Quad1C1", "Quad1C2","Quad1C3","Quad1C4",
-                                "Quad2C1", "Quad2C2","Quad2C3","Quad2C4",'WS_mph','WD',
-                                "MQ131","PM 10 ENV", "PM 25 ENV", "PM 100 ENV", "PM 03 um", "PM 05 um", "PM 10 um",
-                                "PM 25 um", "PM 50 um", "PM 100 um",'OPC1','OPC2','OPC3','OPC4','OPC5', 'unk']
-
-                            }
+settings['column_names'] = dict(pod_schemas.column_names)
 
 ###############
 
@@ -222,96 +178,19 @@ if len(settings['colo_pod_name']) == 0:
 if len(settings['colo_pod_name']) != 1:
     raise KeyError('Run cannot continue because there is more than one unique colocation pod listed in the deployment log for the pollutant of interest.')
 
-#load pod data
-print('Loading colocation pod data...')
-colo_pod_data, deployment_log = data_loading_func.load_data(colo_file_list,deployment_log,settings['column_names'], 'C',settings['pollutant'], settings['ref_timezone'])
-
-if colo_pod_data.empty:
-    raise AssertionError("No colocation pod data was found in the Colocation Pod folder that matched the deployment log. Stopping execution.")
-
-# Load reference data from either CSV or Excel file
-# Check if the CSV file exists, and if not, try loading the Excel file
-print('Loading reference data...')
-try:
-    ref_data = pd.read_csv(os.path.join("Colocation", "Reference", f"{settings['ref_file_name']}.csv"))
-except FileNotFoundError:
-    try:
-        ref_data = pd.read_excel(os.path.join("Colocation", "Reference", f"{settings['ref_file_name']}.xlsx"))
-    except FileNotFoundError:
-        # Handle the case when neither CSV nor Excel file is found
-        raise FileNotFoundError("Reference data file not found")
-
-
-#set index of ref data as the datetime column
-ref_data = ref_data.rename(columns={ref_data.columns[0]: 'datetime'})
-ref_data['datetime']=pd.to_datetime(ref_data['datetime'])
-ref_data.set_index('datetime',inplace=True)
-
-#only include the ref species of interest 
-if isinstance(ref_data, pd.DataFrame):
-    ref_data = ref_data[settings['pollutant']]
-
-# Rename the pollutant column to differentiate from pod data
-ref_data = ref_data.rename(settings['pollutant'] + '_ref')
-
-#colo pod preprocessing
-# FYI: scaling happens in the ML section instead of the preprocess section here BECAUSE WE WANT TO SCALE ONLY THE TRAINING DATA
-print('Preprocessing colocation pod and reference data...')
-colo_pod_data = preprocessing_func.preprocessing_func(colo_pod_data, settings['sensors_included'], settings['t_warmup'], settings['preprocess'])
-
-#ref data preprocessing
-#change 999 to NA
-ref_data.replace(999, pd.NA, inplace=True)
-
-#make sure all columns are numeric to avoid errors later:
-ref_data = pd.to_numeric(ref_data, errors='coerce').astype(float)
-
-# Drop rows with NaN values
-ref_data.dropna(inplace=True)
-
 # Combine ref and colo pod data into one data frame using time_interval and retime_calc
 if not isinstance(settings['time_interval'], str): #first check that time_interval is a string
     settings['time_interval'] = str(settings['time_interval'])
 
-#remove any duplicate rows (based on time). This line will keep the first instance.
-colo_pod_data = colo_pod_data[~colo_pod_data.index.duplicated(keep='first')]
-ref_data = ref_data[~ref_data.index.duplicated(keep='first')]
-
-#time average and align the colocation and reference data
-print('Re-timing colocation pod and reference data...')
-if settings['retime_calc']=='median':
-    data_combined= pd.concat([colo_pod_data, ref_data], axis=1).resample(settings['time_interval']+'min').median()
-if settings['retime_calc']=='mean':
-    data_combined= pd.concat([colo_pod_data, ref_data], axis=1).resample(settings['time_interval']+'min').mean()
-  
-#rename the reference column to the pollutant name    
-data_combined.rename(columns={data_combined.columns[-1]:settings['pollutant']+'_ref'},inplace=True)
-data_combined.dropna(inplace=True)
-
-#add some preprocessing that has to happen after the data is aligned, and therefore can't happen in the "preprocessing" function
-if "add_time_elapsed" in settings['preprocess']:
-    data_combined = preprocessing_func.add_time_elapsed(data_combined, settings['earliest_time'])
-
-#create figaro ratios if using:
-if 'fig2600_2602_ratio' in settings['preprocess']:
-    data_combined = preprocessing_func.fig2600_2602_ratio(data_combined)
-
-if 'fig2600_3_ratio' in settings['preprocess']:
-    data_combined = preprocessing_func.fig2600_3_ratio(data_combined)
-
-if 'fig3_2602_ratio' in settings['preprocess']:
-    data_combined = preprocessing_func.fig3_2602_ratio(data_combined)
-
-if 'fig4_2602_ratio' in settings['preprocess']:
-    data_combined = preprocessing_func.fig4_2602_ratio(data_combined)
+#load, preprocess and time average the colocation pod and reference data (or read them from the pyramid cache)
+data_combined, retime_stats = colocation_data.load_colocation_data(colo_file_list, deployment_log, settings)
 
-if 'fig4_3_ratio' in settings['preprocess']:
-    data_combined = preprocessing_func.fig4_3_ratio(data_combined)
-
-#create the correlation heat map here is if is listed in the colo plot list:
-if 'corr_heatmap' in settings['colo_plot_list']:
-    plotting_func.corr_heatmap(data_combined, output_folder_name)
+if settings['retime_stats']:
+    retime_stats.to_csv(os.path.join('Outputs', output_folder_name, 'colo_retime_stats.csv'))
+    del retime_stats
 
+#rename the reference column to the pollutant name    
+data_combined.rename(columns={data_combined.columns[-1]:settings['pollutant']+'_ref'},inplace=True)
 
 #begin ML
 print('Initializing models...')
@@ -319,34 +198,41 @@ print('Initializing models...')
 X=data_combined.drop([settings['pollutant'] + '_ref'],axis=1)
 y=data_combined[settings['pollutant'] + '_ref']
 
-#if using interaction terms in the model, this is where you add them in:
-if "interaction_terms" in settings['preprocess']:
-    X = preprocessing_func.interaction_terms(X)
+#Train and Test split function (the splits are by position in time, so they pick the same rows of any X with the same times)
+if settings['traintest_split_type'] not in ['end_test', 'mid_end_split', 'start_end_split']:
+    raise KeyError('Invalid traintest_split_type, run is ended')
+traintest_split = getattr(test_train_split_func, settings['traintest_split_type'])
 
-#delete data_combined
-#del data_combined
+#if only keeping some interaction terms, pick the pairs from the sensors and the other features using the training data only
+#(so the test data does not decide which features the model gets). the chosen pairs are saved in settings so the field data gets the same columns
+if "interaction_terms" in settings['preprocess'] and settings['interaction_pairs'] is None and settings['interaction_max_pairs'] is not None:
+    X_before_interactions = feature_graph.build_features(X, [step for step in settings['preprocess'] if step != 'interaction_terms'], settings.get('earliest_time'))
+    X_train_before_interactions, y_train_before_interactions, _, _ = traintest_split(settings['test_percentage'], X_before_interactions, y)
+    settings['interaction_pairs'] = preprocessing_func.select_interaction_pairs(X_train_before_interactions, y_train_before_interactions, settings['interaction_max_pairs'])
+    del X_before_interactions, X_train_before_interactions, y_train_before_interactions
 
-#Train and Test split
-if settings['traintest_split_type'] == 'end_test':
-    X_train, y_train, X_test, y_test = test_train_split_func.end_test(settings['test_percentage'], X, y)
+#add the features that have to be made after the data is aligned (time elapsed, figaro ratios, interaction terms) in one step.
+#the field data gets its features from the same function (see Python_Functions/feature_graph.py for the order of the columns)
+X = feature_graph.build_features(X, settings['preprocess'], settings.get('earliest_time'), settings['interaction_pairs'], dtype=settings['precision'])
 
-elif settings['traintest_split_type'] == 'mid_end_split':
-    X_train, y_train, X_test, y_test = test_train_split_func.mid_end_split(settings['test_percentage'], X, y)
+#create the correlation heat map here is if is listed in the colo plot list:
+if 'corr_heatmap' in settings['colo_plot_list']:
+    plotting_func.corr_heatmap(pd.concat([X, y], axis=1), output_folder_name)
 
-elif settings['traintest_split_type'] == 'start_end_split':
-    X_train, y_train, X_test, y_test = test_train_split_func.start_end_split(settings['test_percentage'], X, y)
+#delete data_combined
+#del data_combined
 
-else: 
-    raise KeyError('Invalid traintest_split_type, run is ended')
+#Train and Test split
+X_train, y_train, X_test, y_test = traintest_split(settings['test_percentage'], X, y)
 
 #Bin-based downsampling happens here, only on training data, if included in preprocessing
 if "binned_resample" in settings['preprocess']:
-    X_train, y_train = preprocessing_func.binned_resample(X_train, y_train, settings['n_bins'], settings['binned_resample_binnum_multiplier'] )
+    X_train, y_train = preprocessing_func.binned_resample(X_train, y_train, settings['n_bins'], settings['binned_resample_binnum_multiplier'], settings['resample_seed'])
 
 #Resampling based on quartiles happens here, only on training data, if included in preprocessing
 if "resample_quartile" in settings['preprocess']:
     for quartile in settings['quartiles_to_resample']:
-        X_train, y_train = preprocessing_func.resample_quartile(X_train, y_train, quartile, settings['quartiles_downsampling_rate'])
+        X_train, y_train = preprocessing_func.resample_quartile(X_train, y_train, quartile, settings['quartiles_downsampling_rate'], settings['resample_seed'])
 
 
 #Scale the data using the technique specified in "scaler"
@@ -355,8 +241,23 @@ X_test_std = settings['scaler'].transform(X_test)
 X_std = pd.DataFrame(data=settings['scaler'].fit_transform(X),columns=X.columns,index=X.index)
 X_std_values = X_std.values
 X_train = X_train_std
+
 X_test = X_test_std
 
+#build the same model inputs from the data loaded, preprocessed and time averaged in float64,
+#to report how much the lower precision changes the model output
+if settings['precision'] != 'float64' and settings['precision_check']:
+    print('Building the colocation model inputs in float64 to compare with the float32 ones...')
+    data_combined_float64, _ = colocation_data.load_colocation_data(colo_file_list, deployment_log, settings, 'float64')
+    X_float64 = feature_graph.build_features(data_combined_float64.iloc[:, :-1], settings['preprocess'], settings.get('earliest_time'),
+                                             settings['interaction_pairs'], dtype='float64')
+    X_std_float64 = pd.DataFrame(clone(settings['scaler']).fit_transform(X_float64), index=X_float64.index)
+    #only the times in both are compared (a value right at a 999 or warm up cutoff can round differently)
+    precision_rows = X_std.index.intersection(X_std_float64.index)
+    X_std_precision = X_std.loc[precision_rows].values
+    X_std_float64 = X_std_float64.loc[precision_rows].values
+    del data_combined_float64, X_float64, precision_rows
+
 
 #save out variables for later analysis
 X_std.to_csv(os.path.join('Outputs', output_folder_name, 'colo_X_std.csv'))
@@ -397,6 +298,9 @@ if settings['models']== ['rf_qw_tuned'] or settings['models']== ['svr_qw_tuned']
                     w, model_name,
                     model_stats)
 
+            if settings['precision'] != 'float64' and settings['precision_check']:
+                model_stats.loc[model_name, 'Precision_RMSE'] = colo_model_func.precision_rmse(current_model, X_std_precision, X_std_float64)
+
             # save out the model and the y predicted
             y_predicted = pd.DataFrame(data=y_predicted, columns=[settings['pollutant']], index=X_std.index)
             y_predicted.to_csv(os.path.join('Outputs', output_folder_name, f'{model_name}_colo_y_predicted.csv'))
@@ -423,6 +327,9 @@ else:
         # Call the function to apply the model_name model
         model_stats, y_train_predicted, y_test_predicted, y_predicted, current_model = model_func(X_train, y_train, X_test, y_test, X_std_values, model_name, model_stats)
 
+        if settings['precision'] != 'float64' and settings['precision_check']:
+            model_stats.loc[model_name, 'Precision_RMSE'] = colo_model_func.precision_rmse(current_model, X_std_precision, X_std_float64)
+
         #save out the model and the y predicted
         y_predicted = pd.DataFrame(data = y_predicted, columns = [settings['pollutant']], index = X_std.index)
         y_predicted.to_csv(os.path.join('Outputs', output_folder_name, f'{model_name}_colo_y_predicted.csv'))
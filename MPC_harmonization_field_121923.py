@@ -18,7 +18,10 @@ from sklearn.metrics import mean_squared_error
 #packages from python_functions folder
 from Python_Functions import preprocessing_func
 from Python_Functions import data_loading_func
+from Python_Functions import pod_cache
 from Python_Functions import plotting_func
+from Python_Functions import feature_graph
+from Python_Functions import retiming_func
 
 #initialize a dictionary (do not edit this line)
 hf_set = {}
@@ -44,6 +47,13 @@ hf_set['crop_field_time']= True    # set to true if you want to crop the field t
 hf_set['field_start']= '2024-2-10 07:15:00' #if field_crop_time is True, set the start time. everything before will be cropped.
 hf_set['field_end']= '2024-2-11 07:14:00'   #if field_crop_time is True, set the end time. everything after will be cropped.
 
+hf_set['fast_parse'] = True    # True reads pod .txt files with the vectorized parser (much faster). False uses the old cell-by-cell float converter
+hf_set['cache_raw_files'] = True    # True saves each parsed pod file in a 'pod_cache' folder next to the data (shared with MPC_colocation), reused until the file, header_type or column_names change
+hf_set['cache_format'] = 'parquet'    # format of the cached pod files: 'parquet' (compressed) or 'npy' (memory-mapped binary array, fastest to open for repeated analyses)
+hf_set['n_workers'] = 1    # number of processes used to import pod files at the same time. 1 imports them one after the other, -1 uses all cores
+hf_set['chunksize'] = None    # None reads each pod file all at once. A number of rows (e.g. 1000000) streams files in chunks and only keeps rows inside the deployment log start/end
+                            # (and inside field_start/field_end when crop_field_time is True)
+
 ###############
 # Check if the output folder exists
 if not os.path.exists(os.path.join('Outputs', colo_output_folder)):
@@ -52,6 +62,8 @@ if not os.path.exists(os.path.join('Outputs', colo_output_folder)):
 settings = joblib.load(os.path.join('Outputs', colo_output_folder, 'run_settings.joblib')) #do not change this line!
 
 settings = {**settings, **hf_set}
+#colocation runs saved before the precision setting was added used float64
+settings.setdefault('precision', 'float64')
 
 #close previous figures
 plt.close('all')
@@ -79,22 +91,34 @@ deployment_log = data_loading_func.load_deployment_log()
 
 # get list of all harmonization files to combine
 harmon_file_list = deployment_log[(deployment_log['deployment'] == 'H')]['file_name']
-# shorten the list to just the pod names (not the whole file name)
-harmon_pod_list = [string.split('_')[0] for string in harmon_file_list]
 
 #Identify the colocation pod in the harmonization data
 colo_pod_name= settings['colo_pod_name']
 if not isinstance(colo_pod_name, str): #first check that colo_pod_name is a string)
     colo_pod_name = colo_pod_name[0]
 
+#settings the preprocessed harmonization and field data depend on. the saved copies (pod_harmonization_data.joblib and
+#pod_field_data.joblib) are only reused while these settings, the pod files and their deployment log rows are unchanged
+preprocess_settings = {
+    'column_names': settings['column_names'],
+    'ref_timezone': settings['ref_timezone'],
+    'sensors_included': settings['sensors_included'],
+    'preprocess': [step for step in settings['preprocess'] if step in preprocessing_func.pod_data_steps],
+    't_warmup': settings['t_warmup'],
+    'precision': settings['precision'],
+}
+
 #load pod data
-if not os.path.exists(os.path.join('Outputs', colo_output_folder, 'pod_harmonization_data.joblib')):
+harmon_key = data_loading_func.preprocessed_key(harmon_file_list, deployment_log, 'H', preprocess_settings)
+pod_harmonization_data = pod_cache.load_keyed(os.path.join('Outputs', colo_output_folder, 'pod_harmonization_data.joblib'), harmon_key)
+if pod_harmonization_data is None:
     # Load harmonization data
-    # make a dictionary with a dataframe for each unique harmonization pod
-    pod_harmonization_data = dict.fromkeys(harmon_pod_list)
-
     print('Loading harmonization pod data from txt files...')
-    pod_harmonization_data, deployment_log = data_loading_func.load_data(harmon_file_list, deployment_log, settings['column_names'], 'H', settings['pollutant'], settings['ref_timezone'])
+    pod_harmonization_data, deployment_log = data_loading_func.load_data(harmon_file_list, deployment_log, settings['column_names'], 'H', settings['pollutant'], settings['ref_timezone'],
+                                                                        fast_parse=settings['fast_parse'], cache=settings['cache_raw_files'], n_workers=settings['n_workers'],
+                                                                        chunksize=settings['chunksize'],
+                                                                        usecols=preprocessing_func.required_columns(settings['sensors_included'], settings['preprocess']),
+                                                                        cache_format=settings['cache_format'], dtype=settings['precision'])
 
     # Check if there is any harmonization data
     assert bool(pod_harmonization_data), "No harmonization data was found in the Harmonization folder that matched the deployment log. Stopping execution."
@@ -102,17 +126,18 @@ if not os.path.exists(os.path.join('Outputs', colo_output_folder, 'pod_harmoniza
     print('Preprocessing harmonization pod and reference data...')
     for podname in pod_harmonization_data:
         #harmonization data preprocessing
-        pod_harmonization_data[podname] = preprocessing_func.preprocessing_func(pod_harmonization_data[podname], settings['sensors_included'], settings['t_warmup'], settings['preprocess'])
+        pod_harmonization_data[podname] = preprocessing_func.preprocessing_func(pod_harmonization_data[podname], settings['sensors_included'], settings['t_warmup'], settings['preprocess'], settings['precision'])
 
     if colo_pod_name not in pod_harmonization_data:
         raise KeyError(f'Harmonization data for the colocation pod {colo_pod_name} was not found in Harmonization folder. Run cannot continue.')
 
-    joblib.dump(pod_harmonization_data, os.path.join('Outputs', colo_output_folder, 'pod_harmonization_data.joblib'))
+    pod_cache.save_keyed(pod_harmonization_data, os.path.join('Outputs', colo_output_folder, 'pod_harmonization_data.joblib'), harmon_key)
 
 else:
     print('Loading preprocessed harmonization pod data from joblib...')
 
-pod_harmonization_data = joblib.load(os.path.join('Outputs', colo_output_folder, 'pod_harmonization_data.joblib'))
+#list of the loaded harmonization pods (a file split by ParticleID gives several pods)
+harmon_pod_list = list(pod_harmonization_data)
 
 #create a dictionary to add harmonized pod timeseries into
 pod_fitted = {key: None for key in pod_harmonization_data}
@@ -153,24 +178,9 @@ for pod_num, podname in enumerate(pod_fitted):
     
     #time average and align the data between the colocation pod (secondary standard) and other pods
     for sensor in settings['sensors_included']:
-        if settings['retime_calc']=='median':
-            #print('concat arg 1')
-            #print(pod_harmonization_data[colo_pod_name][sensor + '_colo'][pod_harmonization_data[colo_pod_name][sensor + '_colo'].index.duplicated()])
-            #print('concat arg 2')
-            # if we drop the duplicates here, higher level functions that don't have duplicates dropped will likely complain that the lengths mismatch....
-            #print(pod_harmonization_data[podname][sensor][pod_harmonization_data[podname][sensor].index.duplicated()])
-            #print('sampling amt')
-            #print(settings['time_interval']+'T')
-            # combine sensor and colo data, resample based on settings... the T modifier (is deprecated, should use min) specifies the minutes to resample with
-            #DF1 = pd.DataFrame([pod_harmonization_data[colo_pod_name][sensor + '_colo']])
-            #DF2 = pd.DataFrame(pod_harmonization_data[podname][sensor])
-            #print(DF1)
-            #print(DF2)
-            # UPDATE 2/12/25 MRD: Received this warning: "FutureWarning: 'T' is deprecated and will be removed in a future version, please use 'min' instead." so I changed lines 169, 171, 314 and 316 to say 'min' instead of 'T'
-            temp= pd.concat([pod_harmonization_data[colo_pod_name][sensor + '_colo'], pod_harmonization_data[podname][sensor]], axis=1).resample(settings['time_interval']+'min').median()
-        if settings['retime_calc']=='mean':
-            temp= pd.concat([pod_harmonization_data[colo_pod_name][sensor + '_colo'], pod_harmonization_data[podname][sensor]], axis=1).resample(settings['time_interval']+'min').mean()
-        temp.dropna(inplace=True)
+        # combine sensor and colo data and time average them (only intervals where both have data are kept)
+        temp = retiming_func.retime([pod_harmonization_data[colo_pod_name][sensor + '_colo'], pod_harmonization_data[podname][sensor]],
+                                    settings['time_interval'], settings['retime_calc'])
 
         if settings['TElapsed_in_harmon']:
             settings['earliest_harmon_time'] = deployment_log[deployment_log['deployment']=='H']['start'].min()
@@ -245,30 +255,45 @@ elif settings['run_field'] == True:
     #Load field data
     #get list of all field files to combine
     field_file_list = deployment_log[(deployment_log['deployment']=='F')]['file_name']
-    #shorten the list to just the pod names (not the whole file name)
-    field_pod_list = [string.split('_')[0] for string in field_file_list]
-
-    if not os.path.exists(os.path.join('Outputs', colo_output_folder, 'pod_field_data.joblib')):
-
-        #make a dictionary with a dataframe for each unique pod
-        pod_field_data = dict.fromkeys(field_pod_list)
 
+    #when streaming the files, apply the field crop while reading. the window starts t_warmup earlier so the warm up
+    #removal in preprocessing still sees the data before field_start (that part is cropped again below)
+    field_window = None
+    if settings['chunksize'] is not None and hf_set['crop_field_time']:
+        field_window = (pd.Timestamp(hf_set['field_start']) - pd.Timedelta(minutes=settings['t_warmup']), hf_set['field_end'])
+
+    #the saved field data is only reused for the same window (a cropped copy is rebuilt when field_start or field_end change)
+    field_key = data_loading_func.preprocessed_key(field_file_list, deployment_log, 'F',
+                                                   {**preprocess_settings, 'field_window': field_window})
+    #the pods of each field file are saved with the data, so field_location can find the deployment of pods that came
+    #from a file split by ParticleID (their names do not start with the file name)
+    saved_field_data = pod_cache.load_keyed(os.path.join('Outputs', colo_output_folder, 'pod_field_data.joblib'), field_key)
+    if saved_field_data is None:
         #load pod data
-        pod_field_data, deployment_log = data_loading_func.load_data(field_file_list, deployment_log, settings['column_names'], 'F',settings['pollutant'], settings['ref_timezone'])
+        pod_field_data, deployment_log = data_loading_func.load_data(field_file_list, deployment_log, settings['column_names'], 'F',settings['pollutant'], settings['ref_timezone'],
+                                                                    fast_parse=settings['fast_parse'], cache=settings['cache_raw_files'], n_workers=settings['n_workers'],
+                                                                    chunksize=settings['chunksize'], time_window=field_window,
+                                                                    usecols=preprocessing_func.required_columns(settings['sensors_included'], settings['preprocess']),
+                                                                    cache_format=settings['cache_format'], dtype=settings['precision'])
 
         for podname in pod_field_data:
             # field data preprocessing
             print(f'Preprocessing pod {podname}...')
             pod_field_data[podname] = preprocessing_func.preprocessing_func(pod_field_data[podname],
                                                                         settings['sensors_included'],
-                                                                        settings['t_warmup'], settings['preprocess'])
+                                                                        settings['t_warmup'], settings['preprocess'], settings['precision'])
 
-        joblib.dump(pod_field_data, os.path.join('Outputs', colo_output_folder, 'pod_field_data.joblib'))
+        field_file_pods = {file: deployment_log.pods(file) for file in field_file_list}
+        pod_cache.save_keyed((pod_field_data, field_file_pods), os.path.join('Outputs', colo_output_folder, 'pod_field_data.joblib'), field_key)
 
     else:
         print('Loading preprocessed field pod data from joblib...')
+        pod_field_data, field_file_pods = saved_field_data
+        for file, pods in field_file_pods.items():
+            deployment_log.set_pods(file, pods)
 
-    pod_field_data = joblib.load(os.path.join('Outputs', colo_output_folder, 'pod_field_data.joblib'))
+    #list of the loaded field pods (a file split by ParticleID gives several pods)
+    field_pod_list = list(pod_field_data)
 
     # Check for pods in field_list not present in harmonization_list
     not_in_harmonization = [item for item in field_pod_list if item not in list(pod_harmonization_data)]
@@ -311,11 +336,7 @@ elif settings['run_field'] == True:
             del melted_X[podname]
         else:
             #time average the pod field data
-            if settings['retime_calc']=='median':
-                temp= pod_field_data[podname].resample(settings['time_interval']+'min').median()
-            if settings['retime_calc']=='mean':
-                temp= pod_field_data[podname].resample(settings['time_interval']+'min').mean()
-            temp.dropna(inplace=True)
+            temp = retiming_func.retime([pod_field_data[podname]], settings['time_interval'], settings['retime_calc'])
 
 
             # Fit and transform the data, and convert it back to a DataFrame
@@ -330,30 +351,11 @@ elif settings['run_field'] == True:
 
                 X_fitted_field[podname][sensor]=harmonization_mdls[podname][sensor].predict(X)
 
-            #create interaction terms if using in the colocation model
-            if "interaction_terms" in settings['preprocess']:
-                X_fitted_field[podname] = preprocessing_func.interaction_terms(X_fitted_field[podname])
-
+            #add the colocation model features (time elapsed, figaro ratios, interaction terms) with the same function as
+            #the colocation script, so the columns and their order match the colocation X exactly.
             #time elapsed needs to come after time averaging to be accurate (at least for median)
-            if "add_time_elapsed" in settings['preprocess']:
-                X_fitted_field[podname] = preprocessing_func.add_time_elapsed(X_fitted_field[podname], settings['earliest_time'])
-
-                #if you are using a fig2600/fig2602 ratio, make that column here
-            if "fig2600_2602_ratio" in settings['preprocess']:
-                X_fitted_field[podname] = preprocessing_func.fig2600_2602_ratio(X_fitted_field[podname])
-
-            if "fig2600_3_ratio" in settings['preprocess']:
-                X_fitted_field[podname] = preprocessing_func.fig2600_3_ratio(X_fitted_field[podname])
-
-            if "fig3_2602_ratio" in settings['preprocess']:
-                X_fitted_field[podname] = preprocessing_func.fig3_2602_ratio(X_fitted_field[podname])
-
-            if "fig4_2602_ratio" in settings['preprocess']:
-                X_fitted_field[podname] = preprocessing_func.fig4_2602_ratio(X_fitted_field[podname])
-
-            if "fig4_3_ratio" in settings['preprocess']:
-                X_fitted_field[podname] = preprocessing_func.fig4_3_ratio(X_fitted_field[podname])
-
+            X_fitted_field[podname] = feature_graph.build_features(X_fitted_field[podname], settings['preprocess'], settings.get('earliest_time'),
+                                                                   settings.get('interaction_pairs'), dtype=settings['precision'])
 
             #Scaling of fitted X field data
             X_fitted_field_std[podname] = settings['scaler'].transform(X_fitted_field[podname])
@@ -377,8 +379,8 @@ elif settings['run_field'] == True:
     del melted_X
 
     # Add location column to plot by this instead of pod
-    Y_field_df = data_loading_func.field_location(Y_field_df, deployment_log)
-    X_fitted_field_df = data_loading_func.field_location(X_fitted_field_df, deployment_log)
+    Y_field_df = data_loading_func.field_location(Y_field_df, deployment_log, settings['ref_timezone'])
+    X_fitted_field_df = data_loading_func.field_location(X_fitted_field_df, deployment_log, settings['ref_timezone'])
 
     #field plotting
     if 'field_timeseries' in settings['field_plot_list']:
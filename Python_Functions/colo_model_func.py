@@ -19,6 +19,12 @@ def save_outputs(model_stats, model_name, current_model, X_train, X_test, y_trai
 
     return model_stats
 
+def precision_rmse(current_model, X_std, X_std_float64):
+    # RMSE between the predictions from the float32 model inputs and from the model inputs built from data that was
+    # loaded, preprocessed and time averaged in float64 (same rows). this is how much settings['precision'] = 'float32'
+    # changes the model output
+    return np.sqrt(mean_squared_error(current_model.predict(X_std_float64), current_model.predict(X_std)))
+
 def lin_reg(X_train, y_train, X_test, y_test, X_std, model_name, model_stats):
     from sklearn.linear_model import LinearRegression
     # Instantiate the LR model:
@@ -0,0 +1,102 @@
+import os
+import pandas as pd
+from Python_Functions import data_loading_func
+from Python_Functions import preprocessing_func
+from Python_Functions import retiming_func
+from Python_Functions import pyramid_cache
+
+# The colocation data MPC_colocation.py fits the models to: the colocation pod data and the reference data, loaded,
+# preprocessed, aligned and time averaged (or read from the pyramid cache when an earlier run already made it).
+
+def load_colocation_data(colo_file_list, deployment_log, settings, precision=None):
+    # the colocation pod and reference data, preprocessed, aligned and time averaged to settings['time_interval']
+    # (the data MPC_colocation.py fits the models to). returns (data_combined, retime stats or None)
+    # precision: overrides settings['precision'] (float32 runs use it to build the same data in float64)
+    settings = {**settings, 'precision': settings['precision'] if precision is None else precision}
+
+    #look for the colocation data already time averaged at time_interval (saved by an earlier run with the same files and preprocessing)
+    data_combined = None
+    retime_stats = None
+    if settings['pyramid_cache']:
+        colo_rows = deployment_log[(deployment_log['deployment']=='C') & (deployment_log['pollutant']==settings['pollutant'])]
+        colo_paths = [data_loading_func.find_data_file(os.path.join('Colocation', 'Pods'), file) for file in colo_file_list]
+        colo_paths.append(data_loading_func.find_data_file(os.path.join('Colocation', 'Reference'), settings['ref_file_name'],
+                                                           data_loading_func.reference_file_extensions))
+        key = pyramid_cache.pyramid_key([path for path in colo_paths if path is not None],
+                                        colo_rows[['file_name', 'timezone', 'start', 'end', 'header_type']], settings)
+        data_combined, retime_stats = pyramid_cache.read_level(key, settings['time_interval'], settings['retime_stats'])
+        if data_combined is not None:
+            print(f"Using colocation pod and reference data time averaged to {settings['time_interval']} min from the pyramid cache...")
+
+    if data_combined is None:
+        #load pod data
+        print('Loading colocation pod data...')
+        colo_pod_data, deployment_log = data_loading_func.load_data(colo_file_list,deployment_log,settings['column_names'], 'C',settings['pollutant'], settings['ref_timezone'],
+                                                                    fast_parse=settings['fast_parse'], cache=settings['cache_raw_files'], n_workers=settings['n_workers'],
+                                                                    chunksize=settings['chunksize'],
+                                                                    usecols=preprocessing_func.required_columns(settings['sensors_included'], settings['preprocess']),
+                                                                    cache_format=settings['cache_format'], dtype=settings['precision'])
+
+        if colo_pod_data.empty:
+            raise AssertionError("No colocation pod data was found in the Colocation Pod folder that matched the deployment log. Stopping execution.")
+
+        # Load reference data from a Parquet, CSV or Excel file
+        print('Loading reference data...')
+        ref_data = data_loading_func.load_reference_data(settings['ref_file_name'])
+
+        #set index of ref data as the datetime column
+        ref_data = ref_data.rename(columns={ref_data.columns[0]: 'datetime'})
+        ref_data['datetime']=pd.to_datetime(ref_data['datetime'])
+        ref_data.set_index('datetime',inplace=True)
+
+        #only include the ref species of interest 
+        if isinstance(ref_data, pd.DataFrame):
+            ref_data = ref_data[settings['pollutant']]
+
+        # Rename the pollutant column to differentiate from pod data
+        ref_data = ref_data.rename(settings['pollutant'] + '_ref')
+
+        #colo pod preprocessing
+        # FYI: scaling happens in the ML section instead of the preprocess section here BECAUSE WE WANT TO SCALE ONLY THE TRAINING DATA
+        print('Preprocessing colocation pod and reference data...')
+        colo_pod_data = preprocessing_func.preprocessing_func(colo_pod_data, settings['sensors_included'], settings['t_warmup'], settings['preprocess'], settings['precision'])
+
+        #ref data preprocessing
+        #change 999 to NA
+        ref_data.replace(999, pd.NA, inplace=True)
+
+        #make sure all columns are numeric to avoid errors later:
+        ref_data = pd.to_numeric(ref_data, errors='coerce').astype(float)
+
+        # Drop rows with NaN values
+        ref_data.dropna(inplace=True)
+
+        #remove any duplicate rows (based on time). This line will keep the first instance.
+        colo_pod_data = colo_pod_data[~colo_pod_data.index.duplicated(keep='first')]
+        ref_data = ref_data[~ref_data.index.duplicated(keep='first')]
+
+        #correct the pod clock
+        if settings['clock_offset']:
+            colo_pod_data.index = colo_pod_data.index + pd.Timedelta(seconds=settings['clock_offset'])
+
+        if settings['alignment'] == 'asof':
+            #pair each reference time with the nearest pod time, then the pairs are time averaged
+            print('Aligning reference data to the nearest colocation pod data...')
+            retime_frames = [retiming_func.align_asof(colo_pod_data, ref_data, settings['asof_tolerance'])]
+        elif settings['alignment'] == 'resample':
+            retime_frames = [colo_pod_data, ref_data]
+        else:
+            raise KeyError(f"Invalid alignment {settings['alignment']}. Options are resample and asof.")
+
+        #time average and align the colocation and reference data (only intervals with both pod and reference data are kept)
+        print('Re-timing colocation pod and reference data...')
+        if settings['pyramid_cache']:
+            # every level of the pyramid is built now, so later runs at 1, 5, 15 or 60 min can start from it
+            data_combined, retime_stats = pyramid_cache.build_pyramid(key, retime_frames, settings['time_interval'],
+                                                                      settings['retime_calc'], settings['retime_stats'])
+        elif settings['retime_stats']:
+            data_combined, retime_stats = retiming_func.retime(retime_frames, settings['time_interval'], settings['retime_calc'], settings['retime_stats'])
+        else:
+            data_combined = retiming_func.retime(retime_frames, settings['time_interval'], settings['retime_calc'])
+
+    return data_combined, retime_stats
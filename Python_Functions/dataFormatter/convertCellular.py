@@ -1,6 +1,32 @@
 import os
 import re
+import copy
+import json
+import hashlib
 import datetime
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+# patterns are compiled once here instead of on every line
+# example line:
+#  "e00fce68c7197b6d5c8bc47e",Sun Feb 16 2025 22:48:25 GMT-0700 (Mountain Standard Time),"[[
+#    so to parse the timestamp, we look for whatever garbage, then a close quote comma to signify the end of device id
+#    and then we grab everything before the timezone in parantheses. timezone changes, the word Time doesn't seem to
+timestamp_pattern = re.compile(r"^.*,(.*) \(.*Time\)")
+# the data entries of a regular line are everything between "[[ and ]]
+regular_data_pattern = re.compile(r"^.*\"\[\[(.*)\]\]")
+# irregular lines have their data right after the timezone
+irregular_prefix_pattern = re.compile(r"^.*\",.* \(.*Time\),")
+# the device id (particle id) is the first, quoted, field
+device_id_pattern = re.compile(r"^\"?([^\",]*)\"?,")
+# Sun Feb 16 2025 22:48:25 GMT-0700
+datetime_pattern = re.compile(r"^\w{3} (\w{3}) (\d{1,2}) (\d{4}) (\d{1,2}):(\d{2}):(\d{2}) ")
+months = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+          'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+# for multiple entries in one line, we add ~11 seconds between them
+#   as per the logging interval determined in the feather's firmware
+sample_interval = datetime.timedelta(seconds=11)
 
 # @name parse_to_datetime
 # @args
@@ -16,6 +42,21 @@ def parse_to_datetime(str_datetime):
     str_datetime_fmt = "%a %b %d %Y %H:%M:%S %Z%z"
     return datetime.datetime.strptime(str_datetime, str_datetime_fmt)
 
+# @name parse_timestamp
+# @args
+#   str_datetime - a string like "Sun Feb 16 2025 22:48:25 GMT-0700"
+# @returns
+#   returns a (naive) datetime.datetime object in the logged local time
+# @notes
+#   same result as parse_to_datetime (the GMT offset is not used in the output either way), but reads the
+#   fields with one compiled pattern, which is much faster than strptime. falls back to strptime otherwise
+def parse_timestamp(str_datetime):
+    match = datetime_pattern.match(str_datetime)
+    if match is None or match.group(1) not in months:
+        return parse_to_datetime(str_datetime).replace(tzinfo=None)
+    month, day, year, hour, minute, second = match.groups()
+    return datetime.datetime(int(year), months[month], int(day), int(hour), int(minute), int(second))
+
 # @name parse_from_datetime
 # @args
 #   datetime_obj - a datetime.datetime object
@@ -27,126 +68,329 @@ def parse_from_datetime(datetime_obj):
     str_datetime_fmt = "%Y-%m-%dT%H:%M:%S"
     return datetime_obj.strftime(str_datetime_fmt)
 
-# TODO: print out system path for the input_folder and output_folder
-input_folder  = 'input'
-output_folder = 'output'
-
-# TODO: if the directory does not exist for input, error out
-
-# if the directory does not exist for output, create it
-if not os.path.exists(output_folder):
-    print('[INFO]: output folder does not exist, creating', output_folder)
-    os.makedirs(output_folder, exist_ok=True)
-
-# going to read through all files in the input_folder and output_folder variables
-#   (you can rename these to pick a different input / output folder)
-# this has been updated to only accept .csv files (was picking up .swp files from vim)
-for input_file in os.scandir(input_folder):
-    if input_file.is_file() and input_file.path.endswith('.csv'):
-        print('[INFO]: Starting parsing', input_file.path)
-        output_file_path = os.path.join(output_folder, input_file.name)
-        print('[INFO]: Writing to', output_file_path)
-        # rf is regex file mnemonic (this is not the ideal way to open files, but we are
-        #   writing and not reading, so who cares)
-        rf = open(output_file_path, 'w')
-        # INFO: line_count is just used to make sure we don't flood stdout with
-        #       every possible print statement - just want to give some insight to
-        #       the user what we are doing
-        line_count = 0
-        irregular_line_count = 0
-        # the following could be done with just an integer, but the boolean
-        #   may make it easier to understand
-        was_last_irregular = False
-        sequential_irregular = 0
-
-        with open(input_file.path, 'r') as tf:
-            # tf is just the variable name for the file, target file is the mnemonic
-            for line in tf:
-                # going to turn one line into multiple, based on how many data points are in each capture
-                # first up is a hash and a timestamp, so let's extract that
-                # example:
-                #  "e00fce68c7197b6d5c8bc47e",Sun Feb 16 2025 22:48:25 GMT-0700 (Mountain Standard Time),"[[ 
-                #    so to parse this, we look for whatever garbage, then a close quote comma to signify the end of device id
-                #    and then we grab everything before the timezone in parantheses. timezone changes, the word Time doesn't seem to
-                re_line_ts = re.sub(r"^.*,(.*) \(.*Time\).*", r"\1", line).strip()
-                line_base_ts = parse_to_datetime(re_line_ts)
-                # line_count is used in a few places to prevent us from doing a bunch of stdout that floods it all
-                if line_count < 3:
-                    print("[INFO]: timestamp found: ", re_line_ts)
-                    print("[INFO]: timestamp parsed to: ", parse_from_datetime(line_base_ts))
-
-                # for some reason - there are two kinds of lines we can encounter.
-                #   so we can use the presence of the "[[" substring to tell what we're dealing with
-                if "[[" in line :
-                    # capture groups are \N based on pattern matching in the first argument
-                    #   (anything wrapped in parentheses is matched)
-                    #re_line = re.sub(r"(.*),(\d+)/(\d+)/(\d+),(.*)", r"\1,20\4-\3-\2T\5", line)
-                    re_line = re.sub(r"^.*\"\[\[(.*)\]\].*", r"\1", line)
-
-                    data_entries = re_line.split('],[')
-                    data_entry_i = 0
-                    for data_entry in data_entries:
-                        # now that we have the entries, let's split the entities into a list, 
-                        #   remove all of the spacing, and get ready to re-write to file
-                        data_entry_split = data_entry.split(',')
-                        data_entry_split = map(str.strip, data_entry_split)
-                        data_entry_split_str = ','.join(data_entry_split)
-                        # for multiple entries (i.e. this loop, we add ~11 seconds between them
-                        #   as per the logging interval determined in the feather's firmware
-                        data_entry_ts = line_base_ts + datetime.timedelta(0,(11 * data_entry_i))
-                        data_entry_ts_str = parse_from_datetime(data_entry_ts)
-                        # now make the string we want to print from the others we've parsed in this loop already
-                        data_entry_string = "%s,%s" %(data_entry_ts_str,data_entry_split_str)
-
-                        # now write the result out
-                        rf.write((data_entry_string + '\n'))
-
-                        # only want to show a brief example of how we are changing the input file on stdout
-                        if line_count < 2:
-                            print(("[%02d]" %(data_entry_i + 1)), data_entry_string)
-                        # increment our data_entry_i index / counter
-                        data_entry_i  += 1
-                    # update boolean to indicate we are not in the irregular entries anymore
-                    was_last_irregular = False
-                else :
-                    if irregular_line_count < 2 :
-                        print('[WARNING]: found irregular line - ', line.strip())
-
-                    # important that this section is done at the "top" of the loop, for how it's written
-                    if was_last_irregular : 
-                        # found another one in this section
-                        sequential_irregular += 1
-                    else : 
-                        # update boolean to indicate we just parsed an irregular line for the first time in a bit
-                        was_last_irregular = True
-                        # we set this to 0, as we so far have 1-in-a-row - this needs to be reset back down or we will
-                        #   continue to increment it between sections and screw things up
-                        sequential_irregular = 0
-
-                    re_line = re.sub(r"^.*\",.* \(.*Time\),", r"", line).strip()
-                    # these irregular lines don't seem to have whitespace to strip, so we're good to take this as-is
-                    data_entry_str = re_line
-                    # correctly offset the timestamp
-                    data_entry_ts = line_base_ts + datetime.timedelta(0,(11 * sequential_irregular))
-                    data_entry_ts_str = parse_from_datetime(data_entry_ts)
-                    # construct the entry string
-                    data_entry_string = "%s,%s" %(data_entry_ts_str,data_entry_str)
-
-                    # now write the result out, preview the first few irregular lines,
-                    #   this is done regardless of line_count, could probably be improved there
-                    if irregular_line_count < 2 :
-                        print('[INFO]: irregular preview', sequential_irregular, '-',  data_entry_string)
-                    rf.write((data_entry_string + '\n'))
-
-                    # for warning messages, keep track of the number of times we do things this way
-                    irregular_line_count += 1
-
-                # iterate line_count so we don't print out the entire file
-                line_count += 1
-        if irregular_line_count > 0 :
-            print('[WARNING]: Found %d irregular lines in %s' %(irregular_line_count, input_file.path))
-        print('[INFO]: Done parsing', input_file.path)
-        # best practice is to close file handlers when done
-        rf.close()
+# @name new_state
+# @returns
+#   returns the state carried from one line to the next while converting a file
+# @notes
+#   irregular lines are one sample each, and sequential irregular lines are offset 11 seconds from each other,
+#   so the converter has to remember whether the last line was irregular and how many in a row there have been
+def new_state():
+    return {'line_count': 0, 'irregular_line_count': 0,
+            'was_last_irregular': False, 'sequential_irregular': 0}
+
+# @name convert_line
+# @args
+#   line - one line of a cellular export
+#   state - dictionary from new_state(), updated in place
+#   include_device_id - if True, each output row starts with the device (particle) id
+# @returns
+#   returns a list of output rows (strings without a newline): timestamp,data...
+# @notes
+#   "[[...]]" lines hold several samples, each 11 seconds after the line timestamp.
+#   irregular lines hold one sample, offset by 11 seconds for each irregular line in a row
+def convert_line(line, state, include_device_id=False):
+    match = timestamp_pattern.match(line)
+    if match is None:
+        # this is what the old script would have tried to parse (and failed on)
+        raise ValueError(f"No timestamp found in cellular line: {line.strip()}")
+    line_base_ts = parse_timestamp(match.group(1).strip())
+
+    prefix = ''
+    if include_device_id:
+        device_match = device_id_pattern.match(line)
+        prefix = (device_match.group(1) if device_match else '') + ','
+
+    rows = []
+    # for some reason - there are two kinds of lines we can encounter.
+    #   so we can use the presence of the "[[" substring to tell what we're dealing with
+    if "[[" in line:
+        data_match = regular_data_pattern.match(line)
+        re_line = data_match.group(1) if data_match else line
+
+        for data_entry_i, data_entry in enumerate(re_line.split('],[')):
+            # split the entities into a list, remove all of the spacing, and get ready to re-write to file
+            data_entry_split_str = ','.join(map(str.strip, data_entry.split(',')))
+            data_entry_ts = line_base_ts + sample_interval * data_entry_i
+            rows.append(prefix + data_entry_ts.isoformat() + ',' + data_entry_split_str)
+        # update boolean to indicate we are not in the irregular entries anymore
+        state['was_last_irregular'] = False
+    else:
+        if state['was_last_irregular']:
+            # found another one in this section
+            state['sequential_irregular'] += 1
+        else:
+            # we set this to 0, as we so far have 1-in-a-row
+            state['was_last_irregular'] = True
+            state['sequential_irregular'] = 0
+
+        prefix_match = irregular_prefix_pattern.match(line)
+        # these irregular lines don't seem to have whitespace to strip, so we're good to take this as-is
+        data_entry_str = (line[prefix_match.end():] if prefix_match else line).strip()
+        data_entry_ts = line_base_ts + sample_interval * state['sequential_irregular']
+        rows.append(prefix + data_entry_ts.isoformat() + ',' + data_entry_str)
+
+        state['irregular_line_count'] += 1
+
+    state['line_count'] += 1
+    return rows
+
+# @name is_cellular_export
+# @args
+#   line - first line of a file
+# @returns
+#   returns True if the line looks like a raw cellular export line (device id, then a timestamp with a named timezone)
+def is_cellular_export(line):
+    return timestamp_pattern.match(line) is not None and device_id_pattern.match(line) is not None
+
+# @name convert_lines
+# @args
+#   lines - iterable of cellular export lines
+#   state - optional state from new_state() (to continue a file)
+#   include_device_id - if True, each output row starts with the device (particle) id
+# @returns
+#   yields output rows (strings without a newline)
+# @notes
+#   with include_device_id, the export can hold lines of several devices (one file for the whole fleet), so each
+#   device keeps its own irregular line sequence. the device states are kept in state['devices']
+def convert_lines(lines, state=None, include_device_id=False):
+    if state is None:
+        state = new_state()
+    if not include_device_id:
+        for line in lines:
+            yield from convert_line(line, state, include_device_id)
+        return
+
+    device_states = state.setdefault('devices', {})
+    for line in lines:
+        device_match = device_id_pattern.match(line)
+        device_id = device_match.group(1) if device_match else ''
+        if device_id not in device_states:
+            device_states[device_id] = new_state()
+        yield from convert_line(line, device_states[device_id], include_device_id)
+
+# @name ConvertedFile
+# @args
+#   rows - iterable of output rows, e.g. from convert_lines
+# @returns
+#   a read-only text file object of the rows (one per line)
+# @notes
+#   rows are only converted when they are read, so pd.read_csv(ConvertedFile(...), chunksize=...) holds one chunk
+#   of the converted file in memory at a time instead of the whole file
+class ConvertedFile:
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            text = self.buffer + ''.join(row + '\n' for row in self.rows)
+            self.buffer = ''
+            return text
+        # convert rows until there is enough text, keeping what is left over for the next read
+        parts = [self.buffer]
+        length = len(self.buffer)
+        while length < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            parts.append(row + '\n')
+            length += len(row) + 1
+        text = ''.join(parts)
+        self.buffer = text[size:]
+        return text[:size]
+
+    def readline(self):
+        # the buffer is always empty or ends at the end of a row (read only converts whole rows)
+        if not self.buffer:
+            row = next(self.rows, None)
+            if row is not None:
+                self.buffer = row + '\n'
+        line, newline, self.buffer = self.buffer.partition('\n')
+        return line + newline
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+# @name watermark_path
+# @args
+#   output_path - converted output file
+# @returns
+#   returns the path of the watermark file kept next to the output in incremental mode
+def watermark_path(output_path):
+    return output_path + '.watermark.json'
+
+# @name head_digest
+# @args
+#   input_path - cellular export .csv
+#   length - number of bytes from the start of the file to hash
+# @returns
+#   returns a hash of the start of the file (used to notice a file that was replaced rather than appended to)
+def head_digest(input_path, length):
+    with open(input_path, 'rb') as f:
+        return hashlib.sha1(f.read(min(length, 4096))).hexdigest()
+
+# @name read_watermark
+# @args
+#   input_path - cellular export .csv
+#   output_path - converted output file
+# @returns
+#   returns the saved watermark if the export was only appended to since the last run, otherwise None
+# @notes
+#   the conversion starts over if the output is missing or was changed, the export shrank, or its start changed
+def read_watermark(input_path, output_path):
+    if not os.path.exists(watermark_path(output_path)) or not os.path.exists(output_path):
+        return None
+    with open(watermark_path(output_path)) as f:
+        watermark = json.load(f)
+    if os.path.getsize(output_path) != watermark['output_size'] + watermark.get('tail_size', 0):
+        return None
+    if os.path.getsize(input_path) < watermark['offset']:
+        return None
+    if head_digest(input_path, watermark['offset']) != watermark['head_digest']:
+        return None
+    return watermark
+
+# @name write_watermark
+# @args
+#   input_path - cellular export .csv
+#   output_path - converted output file
+#   offset - byte offset in the export up to which lines have been converted
+#   state - converter state after the last converted line
+#   last_timestamp - timestamp of the last converted row
+#   output_size - size of the output up to offset
+# @notes
+#   rows written after output_size (from a last line without a newline) are counted as the tail, and rewritten by the next run
+def write_watermark(input_path, output_path, offset, state, last_timestamp, output_size):
+    watermark = {'offset': offset, 'output_size': output_size, 'tail_size': os.path.getsize(output_path) - output_size,
+                 'head_digest': head_digest(input_path, offset), 'last_timestamp': last_timestamp, 'state': state}
+    with open(watermark_path(output_path), 'w') as f:
+        json.dump(watermark, f)
+
+# @name convert_file
+# @args
+#   input_path - cellular export .csv
+#   output_path - file to write the converted rows to
+#   batch_size - number of rows collected before each write
+#   incremental - if True, only convert the lines appended since the last run and append them to the output
+# @returns
+#   returns the final state (line and irregular line counts)
+# @notes
+#   in incremental mode, a watermark (byte offset, last timestamp and the irregular line state) is saved next to
+#   the output. a last line without a newline may still be getting written: it is converted, but the watermark is
+#   kept before it, so the next run removes its rows and converts it again (finished exports without a final newline
+#   are converted completely)
+def convert_file(input_path, output_path, batch_size=10000, incremental=False):
+    watermark = read_watermark(input_path, output_path) if incremental else None
+    if watermark is None:
+        print('[INFO]: Starting parsing', input_path)
+        state = new_state()
+        offset = 0
+        last_timestamp = None
     else:
-        print('[WARNING]: Skipping parsing ', input_file.path, '(not a file)')
+        print('[INFO]: Continuing parsing', input_path, 'from byte', watermark['offset'])
+        state = watermark['state']
+        offset = watermark['offset']
+        last_timestamp = watermark['last_timestamp']
+        # remove the rows of the last run's unterminated last line (it is converted again below)
+        os.truncate(output_path, watermark['output_size'])
+    print('[INFO]: Writing to', output_path)
+
+    batch = []
+    new_line_count = 0
+    # position reached by the lines that end with a newline: (offset, state, last timestamp, output size)
+    complete = None
+    # the export is read as bytes so the offset of every line is known exactly
+    with open(input_path, 'rb') as tf, open(output_path, 'w' if watermark is None else 'a') as rf:
+        tf.seek(offset)
+        for raw_line in tf:
+            if incremental and not raw_line.endswith(b'\n'):
+                # write everything before it so the output size at this point is known
+                if batch:
+                    rf.write('\n'.join(batch) + '\n')
+                    batch = []
+                rf.flush()
+                complete = (offset, copy.deepcopy(state), last_timestamp, os.fstat(rf.fileno()).st_size)
+            try:
+                line = raw_line.decode('utf-8')
+                rows = convert_line(line, state)
+            except ValueError:
+                if complete is None:
+                    raise
+                # the unterminated last line is cut off part way through, a later run converts it
+                break
+            offset += len(raw_line)
+            new_line_count += 1
+            # only want to show a brief example of how we are changing the input file on stdout
+            if state['line_count'] <= 2:
+                print('[INFO]: pre-conversion, post-conversion\n\t', line.strip(), '\n\t', '\n\t '.join(rows))
+            if rows:
+                last_timestamp = rows[-1].split(',', 1)[0]
+            batch.extend(rows)
+            if len(batch) >= batch_size:
+                rf.write('\n'.join(batch) + '\n')
+                batch = []
+        if batch:
+            rf.write('\n'.join(batch) + '\n')
+
+    if incremental:
+        if complete is None:
+            write_watermark(input_path, output_path, offset, state, last_timestamp, os.path.getsize(output_path))
+        else:
+            write_watermark(input_path, output_path, *complete)
+        print('[INFO]: Converted %d new lines' % new_line_count)
+    if state['irregular_line_count'] > 0:
+        print('[WARNING]: Found %d irregular lines in %s' % (state['irregular_line_count'], input_path))
+    print('[INFO]: Done parsing', input_path)
+    return state
+
+# @name convert_folder
+# @args
+#   input_folder - folder of cellular export .csv files
+#   output_folder - folder to write the converted files to (created if needed)
+#   n_workers - number of files converted at the same time (separate processes)
+#   incremental - if True, only convert lines appended since the last run (see convert_file)
+def convert_folder(input_folder='input', output_folder='output', n_workers=1, incremental=False):
+    if not os.path.isdir(input_folder):
+        raise FileNotFoundError(f'[ERROR]: input folder {os.path.abspath(input_folder)} does not exist')
+    print('[INFO]: input folder', os.path.abspath(input_folder))
+    print('[INFO]: output folder', os.path.abspath(output_folder))
+
+    # if the directory does not exist for output, create it
+    if not os.path.exists(output_folder):
+        print('[INFO]: output folder does not exist, creating', output_folder)
+        os.makedirs(output_folder, exist_ok=True)
+
+    # this has been updated to only accept .csv files (was picking up .swp files from vim)
+    jobs = []
+    for input_file in os.scandir(input_folder):
+        if input_file.is_file() and input_file.path.endswith('.csv'):
+            jobs.append((input_file.path, os.path.join(output_folder, input_file.name)))
+        else:
+            print('[WARNING]: Skipping parsing ', input_file.path, '(not a .csv file)')
+
+    if n_workers == 1 or len(jobs) <= 1:
+        for input_path, output_path in jobs:
+            convert_file(input_path, output_path, incremental=incremental)
+    else:
+        # each file is independent, so they can be converted in separate processes
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            list(pool.map(partial(convert_file, incremental=incremental), *zip(*jobs)))
+
+if __name__ == '__main__':
+    # going to read through all files in the input_folder and output_folder variables
+    #   (you can rename these to pick a different input / output folder)
+    input_folder = 'input'
+    output_folder = 'output'
+    # number of files to convert at the same time
+    n_workers = os.cpu_count()
+    # only convert lines appended to each export since the last run (the exports are append-only).
+    #   a file is converted from the start again if it shrank, was replaced, or its output is missing
+    incremental = True
+
+    convert_folder(input_folder, output_folder, n_workers, incremental)
@@ -0,0 +1,219 @@
+import os
+import numpy as np
+import pandas as pd
+
+# date formats tried when sniffing a file, day-first versions before month-first ones
+#   (the raw files changeDate.py was written for are D/M/Y). two digit years are tried before four digit years,
+#   otherwise 16/2/25 would be read as the year 25
+day_first_formats = ['%Y-%m-%d', '%Y/%m/%d', '%d/%m/%y', '%d/%m/%Y', '%m/%d/%y', '%m/%d/%Y', '%d-%m-%y', '%d-%m-%Y']
+month_first_formats = ['%Y-%m-%d', '%Y/%m/%d', '%m/%d/%y', '%m/%d/%Y', '%d/%m/%y', '%d/%m/%Y', '%m-%d-%y', '%m-%d-%Y']
+time_formats = ['%H:%M:%S', '%H:%M', '%H:%M:%S.%f']
+# separators between the date and the time when both are in one column
+datetime_separators = ['T', ' ']
+
+# number of values looked at to pick the candidate formats of a column (spread over the whole column)
+sample_size = 200
+
+# @name date_formats
+# @args
+#   dayfirst - if True, ambiguous dates like 1/2/25 are read as day/month
+# @returns
+#   returns the date formats to try, in order
+def date_formats(dayfirst=True):
+    return day_first_formats if dayfirst else month_first_formats
+
+# @name sample_values
+# @args
+#   values - series of text values
+# @returns
+#   returns up to sample_size non-empty values, spread evenly over the column
+# @notes
+#   the first rows of a 1 Hz file all fall on the same day, so they cannot tell day/month from month/day
+def sample_values(values):
+    sample = values.dropna().astype(str).str.strip()
+    sample = sample[sample != '']
+    if len(sample) > sample_size:
+        sample = sample.iloc[np.unique(np.linspace(0, len(sample) - 1, sample_size).astype(int))]
+    return sample
+
+# @name sniff_formats
+# @args
+#   values - series of text values
+#   formats - candidate formats, in order of preference
+# @returns
+#   returns every format that parses all the sampled values, in order of preference
+def sniff_formats(values, formats):
+    sample = sample_values(values)
+    if sample.empty:
+        return []
+    return [fmt for fmt in formats if pd.to_datetime(sample, format=fmt, errors='coerce').notna().all()]
+
+# @name sniff_format
+# @args
+#   values - series of text values
+#   formats - candidate formats, in order of preference
+# @returns
+#   returns the first format that parses every sampled value, or None
+def sniff_format(values, formats):
+    matches = sniff_formats(values, formats)
+    return matches[0] if matches else None
+
+# @name swap_day_month
+# @args
+#   fmt - date or datetime format
+# @returns
+#   returns the format with the day and month swapped
+def swap_day_month(fmt):
+    return fmt.replace('%d', '%_').replace('%m', '%d').replace('%_', '%m')
+
+# @name datetime_formats
+# @args
+#   dayfirst - if True, ambiguous dates are read as day/month
+# @returns
+#   returns the candidate formats of a column holding both the date and the time
+def datetime_formats(dayfirst=True):
+    return [date_fmt + separator + time_fmt for date_fmt in date_formats(dayfirst)
+            for separator in datetime_separators for time_fmt in time_formats]
+
+# @name parse_datetime
+# @args
+#   dates - series of dates (or of dates and times, if times is None)
+#   times - optional series of times that go with dates
+#   dayfirst - if True, ambiguous dates are read as day/month
+# @returns
+#   returns a series of datetime64 values (NaT only where the date or time is empty)
+# @notes
+#   the candidate formats are sniffed from a sample, then the whole column is parsed in one vectorized call with each
+#   candidate until one reads every date. a format that leaves any date unread is rejected, so a sample from a few days
+#   with day <= 12 cannot pick the wrong day/month order for the rest of the file. if both orders read every date,
+#   dayfirst decides and a warning is printed. if no candidate reads every date, pandas works out the format
+#   (and raises on a date it cannot read)
+def parse_datetime(dates, times=None, dayfirst=True):
+    present = dates.notna() & (dates.astype(str).str.strip() != '')
+    if times is None:
+        text = dates.astype(str).str.strip()
+        candidates = sniff_formats(dates, datetime_formats(dayfirst) + date_formats(dayfirst))
+    else:
+        present &= times.notna() & (times.astype(str).str.strip() != '')
+        text = dates.astype(str).str.strip() + ' ' + times.astype(str).str.strip()
+        time_fmt = sniff_format(times, time_formats)
+        candidates = [] if time_fmt is None else [date_fmt + ' ' + time_fmt for date_fmt in sniff_formats(dates, date_formats(dayfirst))]
+
+    for fmt in candidates:
+        datetimes = pd.to_datetime(text, format=fmt, errors='coerce')
+        if datetimes[present].isna().any():
+            continue
+        swapped = swap_day_month(fmt)
+        if swapped != fmt and swapped in candidates:
+            other = pd.to_datetime(text, format=swapped, errors='coerce')
+            if other[present].notna().all() and not other.equals(datetimes):
+                print('[WARNING]: every date could be day/month or month/day. They were read as %s (dayfirst=%s)'
+                      % ('day/month' if dayfirst else 'month/day', dayfirst))
+        return datetimes
+    return pd.to_datetime(text.where(present), dayfirst=dayfirst)
+
+# @name format_datetime
+# @args
+#   datetimes - series of datetime64 values
+# @returns
+#   returns the values as text in the normalized format, e.g. 2025-02-16T22:48:25 (empty where the date could not be read)
+def format_datetime(datetimes):
+    values = datetimes.to_numpy().astype('datetime64[s]')
+    text = np.datetime_as_string(values, unit='s')
+    text[np.isnat(values)] = ''
+    return text
+
+# @name find_date_columns
+# @args
+#   frame - dataframe of text read without a header
+#   dayfirst - if True, ambiguous dates are read as day/month
+# @returns
+#   returns (date column, time column or None), or (None, None) if no column holds dates
+# @notes
+#   a date column followed by a time column is combined into one datetime column (as changeDate.py did)
+def find_date_columns(frame, dayfirst=True):
+    columns = list(frame.columns)
+    for position, column in enumerate(columns):
+        if sniff_format(frame[column], datetime_formats(dayfirst)) is not None:
+            return column, None
+        if sniff_format(frame[column], date_formats(dayfirst)) is not None:
+            if position + 1 < len(columns) and sniff_format(frame[columns[position + 1]], time_formats) is not None:
+                return column, columns[position + 1]
+            return column, None
+    return None, None
+
+# @name normalize_frame
+# @args
+#   frame - dataframe of text read without a header
+#   dayfirst - if True, ambiguous dates are read as day/month
+# @returns
+#   returns the frame with its date (and time) column replaced by one normalized datetime column
+def normalize_frame(frame, dayfirst=True):
+    # a header line would stop the date column from being recognized, so look past the first row
+    date_column, time_column = find_date_columns(frame.iloc[1:], dayfirst)
+    if date_column is None:
+        return frame
+    first_value = str(frame[date_column].iloc[0]).strip() if len(frame) else ''
+    if first_value and sniff_format(frame[date_column].iloc[:1], datetime_formats(dayfirst) + date_formats(dayfirst)) is None:
+        # the first row is a header (pod .txt files do not have one)
+        frame = frame.iloc[1:]
+
+    times = frame[time_column] if time_column is not None else None
+    datetimes = parse_datetime(frame[date_column], times, dayfirst)
+    unread = int(datetimes.isna().sum())
+    if unread > 0:
+        print('[WARNING]: %d rows have an empty date' % unread)
+
+    frame = frame.copy()
+    frame[date_column] = format_datetime(datetimes)
+    if time_column is not None:
+        frame = frame.drop(columns=time_column)
+    return frame
+
+# @name normalize_file
+# @args
+#   input_path - raw .csv or .txt file
+#   output_path - file to write (defaults to input_path with a .txt extension)
+#   dayfirst - if True, ambiguous dates are read as day/month
+# @returns
+#   returns the normalized dataframe (text)
+# @notes
+#   every column other than the date is read and written as text, so the sensor values are written unchanged.
+#   this replaces the csv to txt copy (convert_csv_to_txt.py) and the date fixing (changeDate.py) with one pass
+def normalize_file(input_path, output_path=None, dayfirst=True):
+    if output_path is None:
+        output_path = os.path.splitext(input_path)[0] + '.txt'
+    print('[INFO]: Starting parsing', input_path)
+    frame = pd.read_csv(input_path, header=None, dtype=str, keep_default_na=False)
+    frame = normalize_frame(frame, dayfirst)
+    print('[INFO]: Writing to', output_path)
+    frame.to_csv(output_path, header=False, index=False)
+    print('[INFO]: Done parsing', input_path)
+    return frame
+
+# @name normalize_folder
+# @args
+#   input_folder - folder of raw files
+#   output_folder - folder to write the normalized files to (created if needed)
+#   dayfirst - if True, ambiguous dates are read as day/month
+def normalize_folder(input_folder='input', output_folder='output', dayfirst=True):
+    if not os.path.isdir(input_folder):
+        raise FileNotFoundError(f'[ERROR]: input folder {os.path.abspath(input_folder)} does not exist')
+    print('[INFO]: input folder', os.path.abspath(input_folder))
+    print('[INFO]: output folder', os.path.abspath(output_folder))
+
+    # if the directory does not exist for output, create it
+    if not os.path.exists(output_folder):
+        print('[INFO]: output folder does not exist, creating', output_folder)
+        os.makedirs(output_folder, exist_ok=True)
+
+    for input_file in os.scandir(input_folder):
+        if input_file.is_file():
+            normalize_file(input_file.path, os.path.join(output_folder, input_file.name), dayfirst)
+        else:
+            print('[WARNING]: Skipping parsing ', input_file.path, '(not a file)')
+
+if __name__ == '__main__':
+    # going to read through all files in the input_folder and output_folder variables
+    #   (you can rename these to pick a different input / output folder)
+    normalize_folder('input', 'output')
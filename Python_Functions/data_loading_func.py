@@ -1,6 +1,50 @@
 import pandas as pd
 import os
 import numpy as np
+import joblib
+from Python_Functions import pod_cache
+from Python_Functions import pod_schemas
+from Python_Functions.dataFormatter import convertCellular
+from Python_Functions.dataFormatter import normalizeDates
+
+# hour offset from UTC for each timezone name allowed in the deployment log
+tz_offsets = {
+    'MST': -7,
+    'PST': -8,
+    'CST': -6,
+    'EST': -5,
+    'MDT': -6,
+    'PDT': -7,
+    'CDT': -5,
+    'EDT': -4,
+    'UTC': 0,
+    'UTC+1': 1,
+    'UTC+2': 2,
+    'UTC+3':3,
+    'UTC+4': 4,
+    'UTC+5': 5,
+    'UTC+6': 6,
+    'UTC+7': 7,
+    'UTC+8': 8,
+    'UTC+9': 9,
+    'UTC+10': 10,
+    'UTC+11': 11,
+    'UTC+12': 12,
+    'UTC+13': 13,
+    'UTC+14': 14,
+    'UTC-1': -1,
+    'UTC-2': -2,
+    'UTC-3': -3,
+    'UTC-4': -4,
+    'UTC-5': -5,
+    'UTC-6': -6,
+    'UTC-7': -7,
+    'UTC-8': -8,
+    'UTC-9': -9,
+    'UTC-10': -10,
+    'UTC-11': -11,
+    'UTC-12': -12
+}
 
 def float_converter(value):
     try:
@@ -8,6 +52,68 @@ def float_converter(value):
     except ValueError:
         return pd.NaT
 
+def pollutant_key(pollutant):
+    # harmonization and field rows usually have no pollutant, which can be read in as NaN
+    return '' if pd.isna(pollutant) else pollutant
+
+class DeploymentLog:
+    # The deployment log dataframe plus a dictionary of its rows, so that looking up a file is one dictionary lookup
+    # instead of a scan of the whole log. Indexing (deployment_log['start'], deployment_log[mask]) still works like the dataframe.
+    def __init__(self, log):
+        self.log = log
+        # pod timezone as hours from UTC (NaN if the timezone name is not in tz_offsets, this errors when the file is loaded)
+        self.log['tz_offset'] = self.log['timezone'].map(tz_offsets).astype(float)
+
+        self.rows = {}  # index label: row of the log as a dictionary
+        self.index = {}  # (file_name, pollutant): index label of the row
+        self.labels = {}  # file_name: index labels of every row for that file
+        self.file_pods = {}  # file_name: pods loaded from that file (set by load_data)
+        for label, row in zip(self.log.index, self.log.to_dict('records')):
+            self.rows[label] = row
+            self.index.setdefault((row['file_name'], pollutant_key(row['pollutant'])), label)
+            self.labels.setdefault(row['file_name'], []).append(label)
+
+    def __getitem__(self, key):
+        return self.log[key]
+
+    def __len__(self):
+        return len(self.log)
+
+    def entry(self, file, pollutant=None):
+        # returns the deployment log row of a file as a dictionary (the first row for that file if no pollutant is given)
+        if pollutant is not None and (file, pollutant_key(pollutant)) in self.index:
+            return self.rows[self.index[(file, pollutant_key(pollutant))]]
+        if file not in self.labels:
+            raise KeyError(f"File {file} is not listed in the deployment log")
+        return self.rows[self.labels[file][0]]
+
+    def set_timezone_change(self, file, timezone_change_from_ref):
+        for label in self.labels[file]:
+            self.log.at[label, 'timezone_change_from_ref'] = timezone_change_from_ref
+            self.rows[label]['timezone_change_from_ref'] = timezone_change_from_ref
+
+    def set_pods(self, file, pods):
+        self.file_pods[file] = list(pods)
+
+    def pods(self, file):
+        # pods whose data came from a file. files split by ParticleID can hold several pods, every other file
+        # (or a file that has not been loaded) is one pod named by the start of the file name
+        return self.file_pods.get(file, [file.split('_')[0]])
+
+    def check_overlaps(self):
+        # warn about deployment windows of the same pod (same deployment type and pollutant) that overlap in time.
+        # sorting by start time means each window only needs to be compared to the one before it
+        log = self.log.assign(pod=[file.split('_')[0] for file in self.log['file_name']],
+                              pollutant=self.log['pollutant'].fillna(''))
+        log = log.sort_values(['pod', 'deployment', 'pollutant', 'start'], kind='mergesort')
+        same_group = (log[['pod', 'deployment', 'pollutant']] == log[['pod', 'deployment', 'pollutant']].shift()).all(axis=1)
+        same_file = log['file_name'] == log['file_name'].shift()
+        overlapping = same_group & ~same_file & (log['start'] < log['end'].shift())
+        previous_file = log['file_name'].shift()
+        for file, previous in zip(log['file_name'][overlapping], previous_file[overlapping]):
+            print(f"WARNING: deployment log windows for {previous} and {file} overlap in time.")
+        return list(zip(previous_file[overlapping], log['file_name'][overlapping]))
+
 def load_deployment_log():
     # Load deployment from either CSV or Excel file
     try:
@@ -46,167 +152,409 @@ def load_deployment_log():
 
     deployment_log['timezone_change_from_ref'] = np.nan
 
-    return deployment_log
+    deployment_log = DeploymentLog(deployment_log)
+    # check for overlapping deployment windows once here, instead of finding out when the data is combined
+    deployment_log.check_overlaps()
 
-def load_data(data_file_list, deployment_log, column_names, deployment_type, pollutant, ref_timezone):
-
-    tz = {
-        'MST': -7,
-        'PST': -8,
-        'CST': -6,
-        'EST': -5,
-        'MDT': -6,
-        'PDT': -7,
-        'CDT': -5,
-        'EDT': -4,
-        'UTC': 0,
-        'UTC+1': 1,
-        'UTC+2': 2,
-        'UTC+3':3,
-        'UTC+4': 4,
-        'UTC+5': 5,
-        'UTC+6': 6,
-        'UTC+7': 7,
-        'UTC+8': 8,
-        'UTC+9': 9,
-        'UTC+10': 10,
-        'UTC+11': 11,
-        'UTC+12': 12,
-        'UTC+13': 13,
-        'UTC+14': 14,
-        'UTC-1': -1,
-        'UTC-2': -2,
-        'UTC-3': -3,
-        'UTC-4': -4,
-        'UTC-5': -5,
-        'UTC-6': -6,
-        'UTC-7': -7,
-        'UTC-8': -8,
-        'UTC-9': -9,
-        'UTC-10': -10,
-        'UTC-11': -11,
-        'UTC-12': -12
-    }
+    return deployment_log
 
+def load_particle_ids():
+    # Load the table of device (particle) ids of combined cellular exports and the pod name of each one.
+    # Columns: 'ParticleID', 'pod'. See split_by_device for how files with ids that are not in the table are named
+    try:
+        particle_ids = pd.read_csv("particle_ids.csv", dtype=str)
+    except FileNotFoundError:
+        try:
+            particle_ids = pd.read_excel("particle_ids.xlsx", dtype=str)
+        except FileNotFoundError:
+            return {}
+
+    if not all(column in particle_ids.columns for column in [pod_schemas.device_id_column, 'pod']):
+        raise KeyError(f"Particle id table is missing essential columns. Please change the columns to include the following: '{pod_schemas.device_id_column}', 'pod'")
+
+    return dict(zip(particle_ids[pod_schemas.device_id_column].str.strip(), particle_ids['pod'].str.strip()))
+
+def split_by_device(temp, particle_ids, file):
+    # split a loaded combined export into one dataframe per pod in a single groupby pass
+    # (instead of filtering the whole file once for every pod). returns a list of (pod name, dataframe)
+    device_ids = temp[pod_schemas.device_id_column].dropna().unique()
+    if len(device_ids) <= 1 and not any(device_id in particle_ids for device_id in device_ids):
+        # an ordinary single pod file (its header type just has a ParticleID column): the pod name is the start of the file name
+        return [(file.split('_')[0], temp.drop(columns=pod_schemas.device_id_column))]
+
+    unmapped = [device_id for device_id in device_ids if device_id not in particle_ids]
+    if unmapped:
+        print(f"WARNING: particle ids {unmapped} in file {file} are not in the particle id table. Their pods are named by the particle id.")
+    pods = []
+    for particle_id, device_data in temp.groupby(pod_schemas.device_id_column, sort=False):
+        pods.append((particle_ids.get(particle_id, particle_id), device_data.drop(columns=pod_schemas.device_id_column)))
+    return pods
+
+# file formats read by load_data, in the order they are looked for. Parquet is the fast path (columnar, typed,
+# only the needed columns are read). csv files are read directly, there is no need to copy them to .txt first
+data_file_extensions = ['.parquet', '.txt', '.csv', '.xlsx']
+
+def find_data_file(data_path, file, extensions=None):
+    # path of the first {file}{extension} in data_path, or None if there is no such file
+    for extension in (data_file_extensions if extensions is None else extensions):
+        file_path = os.path.join(data_path, f'{file}{extension}')
+        if os.path.exists(file_path):
+            return file_path
+    return None
+
+reference_file_extensions = ['.parquet', '.csv', '.txt', '.xlsx']
+
+def load_reference_data(ref_file_name, data_path=os.path.join("Colocation", "Reference")):
+    # Load reference data from a parquet, CSV or Excel file (the first column is the datetime)
+    file_path = find_data_file(data_path, ref_file_name, reference_file_extensions)
+    if file_path is None:
+        # Handle the case when no reference file is found
+        raise FileNotFoundError("Reference data file not found")
+
+    if file_path.endswith('.parquet'):
+        ref_data = pd.read_parquet(file_path)
+        # a datetime index is put back as the first column, like the other formats
+        if isinstance(ref_data.index, pd.DatetimeIndex):
+            ref_data = ref_data.reset_index()
+        return ref_data
+    if file_path.endswith('.xlsx'):
+        return pd.read_excel(file_path)
+    return pd.read_csv(file_path)
+
+def get_datetime_columns(columns):
+    # datetime columns are parsed separately from the numeric sensor columns
+    if 'datetime' in columns:
+        return ['datetime']
+    elif 'date' in columns and 'time' in columns:
+        return ['date', 'time']
+    return None
+
+def format_pod_data(temp, columns, datetime_columns, fast_parse=False):
+    if fast_parse:
+        # anything that could not be read as a number (corrupted lines, text) is coerced to NaN in one step.
+        # only columns that did not come out numeric need this, the rest were already parsed as numbers
+        numeric_columns = pod_schemas.numeric_columns(columns)
+        object_columns = [column for column in numeric_columns if not pd.api.types.is_numeric_dtype(temp[column])]
+        if object_columns:
+            temp[object_columns] = temp[object_columns].apply(pd.to_numeric, errors='coerce')
+        temp[numeric_columns] = temp[numeric_columns].astype('float64')
+
+    if len(columns) != len(temp.columns):
+        raise KeyError("Number of column names does not match the number of columns in the colocation data.")
+
+    if 'date' in temp and 'time' in temp:
+        # the date format is worked out once from the first rows, then every row is parsed in one call
+        temp['datetime'] = normalizeDates.parse_datetime(temp['date'], temp['time'], dayfirst=False)
+        temp = temp.drop(['date', 'time'], axis=1)
+    else:
+        temp['datetime'] = pd.to_datetime(temp['datetime'])
+    temp.set_index('datetime', inplace=True)
+
+    return temp
+
+def read_parquet_pod_file(file_path, columns, usecols=None):
+    # parquet pod files have named, typed columns, so only the needed columns are read and nothing has to be parsed.
+    # the timestamp can be a 'datetime' column or the index
+    data_columns = [column for column in columns if column not in pod_schemas.datetime_column_names]
+    if usecols is not None:
+        data_columns = [column for column in data_columns if column in usecols or column == pod_schemas.device_id_column]
+
+    # a 'datetime' column (or named index) is read with the data. otherwise the index saved with the file is used
+    # (pyarrow is what pandas reads parquet with, so it is there whenever parquet files can be read)
+    import pyarrow.parquet
+    stored_columns = pyarrow.parquet.read_schema(file_path).names
+    temp = pd.read_parquet(file_path, columns=data_columns + (['datetime'] if 'datetime' in stored_columns else []))
+    if 'datetime' in temp.columns:
+        temp['datetime'] = pd.to_datetime(temp['datetime'])
+        temp = temp.set_index('datetime')
+    elif not isinstance(temp.index, pd.DatetimeIndex):
+        raise KeyError(f"Parquet file {file_path} has no 'datetime' column or datetime index.")
+    temp.index.name = 'datetime'
+    return temp[data_columns]
+
+def read_pod_file(file_path, columns, fast_parse=False, chunksize=None, start=None, end=None, usecols=None):
+    if file_path.endswith('.parquet'):
+        # the deployment window is applied by load_file
+        return read_parquet_pod_file(file_path, columns, usecols)
+
+    #first, check the datetime columns (if they exist)
+    datetime_columns = get_datetime_columns(columns)
+    if datetime_columns is None:
+        raise KeyError(
+            f"File {file_path} does not include datetime column OR date column and time column. Fix 'column_names' variable")
+
+    # usecols: only parse these columns (plus the datetime columns), the other columns of the file are skipped by the parser
+    all_columns = columns
+    if usecols is not None:
+        columns = [column for column in columns if column in datetime_columns or column in usecols]
+
+    if fast_parse:
+        # read the numeric columns with the C parser (no per-cell python calls), keeping the datetime columns as text
+        read_options = dict(dtype={column: str for column in datetime_columns})
+    else:
+        # Create a dictionary with column names as keys and the custom converter function as values
+        converter_dict = {column: float_converter for column in pod_schemas.numeric_columns(columns)}
+        if datetime_columns == ['datetime']:
+            read_options = dict(parse_dates=datetime_columns, converters=converter_dict)
+        else:
+            # separate date and time columns are read as text and parsed together in format_pod_data
+            read_options = dict(dtype={column: str for column in datetime_columns}, converters=converter_dict)
+    # the device id of combined cellular exports stays text
+    if pod_schemas.device_id_column in columns:
+        read_options['dtype'] = dict(read_options.get('dtype', {}), **{pod_schemas.device_id_column: str})
+
+    if usecols is not None:
+        read_options['usecols'] = columns
+
+    if file_path.endswith('.xlsx'):
+        # excel files can not be streamed, so they are always read whole (the window is applied by load_file)
+        read_options.pop('usecols', None)
+        temp = pd.read_excel(file_path, header=None, names=all_columns, **read_options)
+        return format_pod_data(temp[columns], columns, datetime_columns, fast_parse)
+
+    # raw cellular exports (see dataFormatter/convertCellular.py) are converted while they are read,
+    # instead of writing the converted file to disk and reading it back
+    with open(file_path, 'r') as f:
+        first_line = f.readline()
+    if not convertCellular.is_cellular_export(first_line):
+        return read_text_pod_file(file_path, all_columns, columns, datetime_columns, read_options, fast_parse, chunksize, start, end)
+    with open(file_path, 'r') as f:
+        # lines are only converted as read_csv asks for more text, so in streaming mode only one chunk is held at a time
+        rows = convertCellular.convert_lines(f, include_device_id=(all_columns[0] == pod_schemas.device_id_column))
+        return read_text_pod_file(convertCellular.ConvertedFile(rows), all_columns, columns, datetime_columns, read_options, fast_parse,
+                                  chunksize, start, end)
+
+def read_text_pod_file(source, all_columns, columns, datetime_columns, read_options, fast_parse=False, chunksize=None, start=None, end=None):
+    # source: path of a .txt/.csv pod file, or a file object of converted cellular export rows
+    if chunksize is None:
+        temp = pd.read_csv(source, header=None, names=all_columns, **read_options)
+        return format_pod_data(temp, columns, datetime_columns, fast_parse)
+
+    # streaming mode: read chunksize rows at a time and only keep the rows between start and end,
+    # so the parts of the file outside the deployment window are never all in memory at once
+    kept_chunks = []
+    for chunk in pd.read_csv(source, header=None, names=all_columns, chunksize=chunksize, **read_options):
+        chunk = format_pod_data(chunk, columns, datetime_columns, fast_parse)
+        time_removed = (chunk.index < start) | (chunk.index > end)
+        if not time_removed.all():
+            kept_chunks.append(chunk[~time_removed])
+
+    if not kept_chunks:
+        # nothing in the window. return an empty frame with the right columns
+        return chunk.iloc[:0]
+    if len(kept_chunks) == 1:
+        return kept_chunks[0]
+    return pd.concat(kept_chunks, axis=0)
+
+def load_file(file_path, data_path, file, header_type, columns, start, end, timezone_change_from_ref, fast_parse=False, cache=False,
+              chunksize=None, usecols=None, cache_format='parquet', dtype='float64'):
+    # read, crop and timezone correct one pod file. this only uses its arguments, so files can be loaded in parallel
+    print(f'Importing {file}')
+    # the columns of this header_type that are needed (datetime columns and the device id are always read)
+    if usecols is not None:
+        usecols = [column for column in columns if column in usecols or column == pod_schemas.device_id_column]
+
+    # parquet files are already as fast to read as the cache
+    cache = cache and not file_path.endswith('.parquet')
+    cache_format = pod_cache.stored_format(cache_format, columns)
+
+    temp = None
+    if cache:
+        # use the parsed copy of this file if the file, header_type and column names have not changed
+        key = pod_cache.cache_key(file_path, header_type, columns)
+        temp = pod_cache.read_cache(data_path, file, key, usecols, cache_format, start, end)
+        if temp is not None:
+            print(f'Loaded {file} from cache')
+
+    if temp is None:
+        if chunksize is not None:
+            # streamed files only keep the deployment window, so they are not saved to the cache
+            temp = read_pod_file(file_path, columns, fast_parse, chunksize, start, end, usecols)
+        elif cache:
+            # the cache always holds every column, so it can be reused when sensors_included changes
+            temp = read_pod_file(file_path, columns, fast_parse)
+            pod_cache.write_cache(temp, data_path, file, key, cache_format)
+            if usecols is not None:
+                temp = temp[usecols]
+        else:
+            temp = read_pod_file(file_path, columns, fast_parse, usecols=usecols)
+
+    # crop data based on deployment log (only copied when there are rows to remove)
+    time_removed = (temp.index < start) | (temp.index > end)
+    if time_removed.any():
+        temp = temp[~time_removed]
+
+    # correct datetime to the reference data timezone
+    temp.index = temp.index - pd.to_timedelta(timezone_change_from_ref, unit='h')
+
+    # 'float32' halves the memory of the loaded data (the sensors are 10-16 bit readings, so nothing is lost)
+    if dtype != 'float64':
+        numeric_columns = pod_schemas.numeric_columns(temp.columns)
+        # the slow parser leaves NaT in cells it could not read. they become NaN here, as clean_numeric does for float64
+        temp[numeric_columns] = temp[numeric_columns].apply(pd.to_numeric, errors='coerce').astype(dtype)
+
+    return temp
+
+def combine_pod_files(files):
+    # combine all the loaded files of one pod (list of (file name, dataframe)) with a single concat.
+    # rows are sorted by time and rows with a repeated timestamp are dropped, keeping the row from the earlier file
+    time_ranges = [(temp.index.min(), temp.index.max(), file) for file, temp in files if not temp.empty]
+    time_ranges.sort(key=lambda time_range: time_range[0])
+    for previous, current in zip(time_ranges[:-1], time_ranges[1:]):
+        if current[0] <= previous[1]:
+            print(f"Files {previous[2]} and {current[2]} overlap in time. Repeated timestamps are only kept from the first file.")
+
+    if len(files) == 1:
+        pod_data = files[0][1]
+    else:
+        pod_data = pd.concat([temp for file, temp in files], axis=0, join='outer')
+
+    # stable sort so that for repeated timestamps the first file (and first row within a file) comes first
+    pod_data = pod_data.sort_index(kind='mergesort')
+    pod_data = pod_data[~pod_data.index.duplicated(keep='first')]
+    return pod_data
+
+def data_folder(deployment_type):
+    # folder of the pod files of each deployment type in the deployment log
     if deployment_type == 'H':
-        # get a list of all the pods (not full file names)
-        pod_list = [string.split('_')[0] for string in data_file_list]
-        # make a dictionary to put loaded data into, separated by pod names
-        pod_data = dict.fromkeys(pod_list)
-        data_path = 'Harmonization'
-
+        return 'Harmonization'
     if deployment_type == 'F':
-        # get a list of all the pods (not full file names)
-        pod_list = [string.split('_')[0] for string in data_file_list]
-        # make a dictionary to put loaded data into, separated by pod names
-        pod_data = dict.fromkeys(pod_list)
-        data_path = 'Field'
-
-    if deployment_type == 'C':
-        data_path = os.path.join('Colocation', 'Pods')
-        pod_data = pd.DataFrame()
-
-    for i, file in enumerate(data_file_list):
-        print(f'Importing {file}')
-        # get the correct column names list based on the "header_type" in deployment log
+        return 'Field'
+    return os.path.join('Colocation', 'Pods')
+
+def preprocessed_key(data_file_list, deployment_log, deployment_type, used_settings):
+    # key of the loaded and preprocessed data of a deployment type: the contents of its files (and of the particle id
+    # table), their deployment log rows and used_settings. used to know when a saved copy of that data is out of date
+    data_path = data_folder(deployment_type)
+    file_paths = [find_data_file(data_path, file) for file in data_file_list]
+    file_paths += ['particle_ids.csv', 'particle_ids.xlsx']
+    rows = deployment_log[(deployment_log['deployment'] == deployment_type) & deployment_log['file_name'].isin(list(data_file_list))]
+    return pod_cache.inputs_key([path for path in file_paths if path is not None and os.path.exists(path)],
+                                rows[['file_name', 'pollutant', 'timezone', 'start', 'end', 'header_type']], used_settings)
+
+def load_data(data_file_list, deployment_log, column_names, deployment_type, pollutant, ref_timezone, fast_parse=False, cache=False, n_workers=1,
+              chunksize=None, time_window=None, usecols=None, cache_format='parquet', particle_ids=None, dtype='float64'):
+
+    data_path = data_folder(deployment_type)
+
+    # first, look up everything each file needs from the deployment log.
+    # the files themselves are independent of each other until they are combined by pod at the end
+    files_to_load = []
+    for file in data_file_list:
+        # get the deployment log row of the file (colocation files can be listed once per pollutant)
         if deployment_type == 'C':
-            header_type = deployment_log[(deployment_log['file_name'] == file) & (deployment_log['pollutant'] == pollutant)]['header_type'].to_string(index=False)
+            log_entry = deployment_log.entry(file, pollutant)
         else:
-            header_type = deployment_log[deployment_log['file_name'] == file]['header_type'].to_string(index=False)
+            log_entry = deployment_log.entry(file)
+
+        # get the correct column names list based on the "header_type" in deployment log
+        header_type = log_entry['header_type']
         if header_type not in column_names:
             raise KeyError(f"Header type {header_type} in deployment log does not match any column names options")
 
         # read the individual data file (to be combined after correcting the datetime)
-        if os.path.exists(os.path.join(data_path, f'{file}.txt')):
-
-            #first, check the datetime columns (if they exist)
-            if 'datetime' in column_names[header_type]:
-                # datetime columns to exclude from the converters
-                datetime_columns = ['datetime']
-            elif 'date' in column_names[header_type] and 'time' in column_names[header_type]:
-                datetime_columns = ['date', 'time']
-            else:
-                raise KeyError(
-                    f"File {file}  does not include datetime column OR date column and time column. Fix 'column_names' variable")
-
-            # Create a dictionary with column names as keys and the custom converter function as values
-            converter_dict = {column: float_converter for column in column_names[header_type] if
-                              column not in datetime_columns}
-
-            temp = pd.read_csv(
-                os.path.join(data_path, f'{file}.txt'),
-                header=None, names=column_names[header_type],
-                parse_dates=datetime_columns, converters=converter_dict)
-
-            if len(column_names[header_type]) != len(temp.columns):
-                raise KeyError("Number of column names does not match the number of columns in the colocation data.")
-
-            if 'date' in temp and 'time' in temp:
-                temp['datetime'] = temp['date'] + 'T' + temp['time']
-                temp = temp.drop(['date', 'time'], axis=1)
-
-            temp['datetime'] = pd.to_datetime(temp['datetime'])
-            temp.set_index('datetime', inplace=True)
-
+        # (.parquet, .txt, .csv or .xlsx. raw cellular exports can be used directly, they are converted while loading)
+        file_path = find_data_file(data_path, file)
+        if file_path is not None:
             # crop data based on deployment log
-            start = deployment_log[(deployment_log['file_name'] == file)]['start'].iat[0]
-            end = deployment_log[(deployment_log['file_name'] == file)]['end'].iat[0]
-            time_removed = (temp.index < start) | (temp.index > end)
-            temp = temp[~time_removed]
+            start = log_entry['start']
+            end = log_entry['end']
 
             # correct datetime to the reference data timezone
-            pod_timezone = deployment_log[(deployment_log['file_name'] == file)]['timezone'].iloc[0]
+            if np.isnan(log_entry['tz_offset']):
+                raise KeyError(f"Timezone {log_entry['timezone']} of file {file} in deployment log is not a recognized timezone")
 
-            timezone_change_from_ref = tz[pod_timezone] - tz[ref_timezone]
-            deployment_log.loc[(deployment_log['file_name'] == file),'timezone_change_from_ref'] =  timezone_change_from_ref
-            temp.index = temp.index - pd.to_timedelta(timezone_change_from_ref, unit='h')
+            timezone_change_from_ref = log_entry['tz_offset'] - tz_offsets[ref_timezone]
+            deployment_log.set_timezone_change(file, timezone_change_from_ref)
 
             #old way of doing timezone correction that wasn't based on actual timezones:
             #timezone_change_from_ref = deployment_log[(deployment_log['file_name'] == file)]['timezone_change_from_ref'].iloc[0]
-            #temp.index = temp.index - pd.to_timedelta(timezone_change_from_ref, unit='h')
 
-            if deployment_type == 'C':
-                # merge multiple colo files (if applicable)
-                if i == 0:
-                    pod_data = temp
-                else:
-                    pod_data = pd.concat([pod_data, temp], axis=0, join='outer')
-
-            elif deployment_type == 'H' or deployment_type == 'F':
-                pod_name = pod_list[i]
-                # either save the pod data in a new dataframe in the field dictionary, or add the data to the preexisting dataframe for that pod
-                # (if there is multiple field files for a pod)
-                if isinstance(pod_data[pod_name], pd.DataFrame):
-                    pod_data[pod_name] = pd.concat([pod_data[pod_name], temp], axis=0, join='outer')
-                else:
-                    pod_data[pod_name] = temp
+            # an extra (start, end) window in the reference timezone, e.g. the field crop. It is converted to the pod
+            # timezone so it can be applied together with the deployment log start and end
+            if time_window is not None:
+                start = max(start, pd.Timestamp(time_window[0]) + pd.to_timedelta(timezone_change_from_ref, unit='h'))
+                end = min(end, pd.Timestamp(time_window[1]) + pd.to_timedelta(timezone_change_from_ref, unit='h'))
 
+            files_to_load.append((file, (file_path, data_path, file, header_type, column_names[header_type], start, end,
+                                         timezone_change_from_ref, fast_parse, cache, chunksize, usecols, cache_format, dtype)))
 
         else:
             print()
             print(f"File {file} listed in deployment log does not exist in folder. This data will be skipped!")
             print()
 
-    # Remove None values from the dictionary in place
-    if isinstance(pod_data, dict):
-        pod_data = {key: value for key, value in pod_data.items() if value is not None}
+    # import the files, either one after the other or spread across n_workers processes.
+    # results come back in the same order as data_file_list either way
+    if n_workers == 1 or len(files_to_load) <= 1:
+        loaded = [load_file(*args) for file, args in files_to_load]
+    else:
+        print(f'Importing {len(files_to_load)} files using {n_workers} workers...')
+        loaded = joblib.Parallel(n_jobs=n_workers)(joblib.delayed(load_file)(*args) for file, args in files_to_load)
+
+    # collect the loaded files of each pod (in data_file_list order), then combine each pod's files in one step
+    pod_files = {}
+    for (file, args), temp in zip(files_to_load, loaded):
+        if pod_schemas.device_id_column in temp.columns:
+            # files with a ParticleID column can hold several pods (combined cellular exports), so they are split by it
+            if particle_ids is None:
+                particle_ids = load_particle_ids()
+            device_pods = split_by_device(temp, particle_ids, file)
+            if deployment_type == 'C':
+                if len(device_pods) > 1:
+                    print(f"WARNING: colocation file {file} holds data from {len(device_pods)} devices. They are combined as one pod.")
+                device_pods = [('colocation', device_data) for pod_name, device_data in device_pods]
+            for pod_name, device_data in device_pods:
+                pod_files.setdefault(pod_name, []).append((file, device_data))
+            deployment_log.set_pods(file, [pod_name for pod_name, device_data in device_pods])
+            continue
 
-    return pod_data, deployment_log
+        if deployment_type == 'C':
+            pod_name = 'colocation'
+        else:
+            # pod names are the start of the file name
+            pod_name = file.split('_')[0]
+        pod_files.setdefault(pod_name, []).append((file, temp))
+        deployment_log.set_pods(file, [pod_name])
 
-def field_location(Y_field_df, deployment_log):
-    Y_field_df['location'] = str()
-    field_deployment_log = pd.DataFrame(deployment_log[deployment_log['deployment'] == 'F']).set_index('file_name')
-    field_deployment_log['pod'] = [filename.split('_')[0] for filename in field_deployment_log.index]
+    pod_data = {pod_name: combine_pod_files(files) for pod_name, files in pod_files.items()}
 
-    for file in field_deployment_log.index:
-        # unconvert the pod datetime so that we can compare it to start/stop before the reference timezone change
-        timezone_change_from_ref = field_deployment_log.loc[file, 'timezone_change_from_ref']
+    if deployment_type == 'C':
+        pod_data = pod_data.get('colocation', pd.DataFrame())
 
-        mask = (Y_field_df['pod'] == field_deployment_log.loc[file, 'pod']) & \
-               (Y_field_df['datetime'] + pd.to_timedelta(timezone_change_from_ref, unit='h') > field_deployment_log.loc[
-                   file, 'start']) & \
-               (Y_field_df['datetime'] + pd.to_timedelta(timezone_change_from_ref, unit='h') < field_deployment_log.loc[
-                   file, 'end'])
-        Y_field_df.loc[mask, 'location'] = field_deployment_log.loc[file, 'location']
+    return pod_data, deployment_log
 
-    return Y_field_df
\ No newline at end of file
+def field_location(Y_field_df, deployment_log, ref_timezone=None):
+    # label each row of Y_field_df (columns 'pod' and 'datetime') with the location of the field deployment it falls in.
+    # each pod's deployment windows are sorted by start time, and every timestamp is matched to the last window that
+    # starts before it with a binary search (instead of checking every row against every file)
+    field_deployment_log = deployment_log[deployment_log['deployment'] == 'F']
+
+    # unconvert the pod datetime so that we can compare it to start/stop before the reference timezone change.
+    # this is done once on the windows (converted to the reference timezone) instead of on every row of data
+    timezone_change_from_ref = field_deployment_log['timezone_change_from_ref']
+    if ref_timezone is not None:
+        # field data loaded from pod_field_data.joblib did not go through load_data, so compute the change here
+        timezone_change_from_ref = timezone_change_from_ref.fillna(field_deployment_log['tz_offset'] - tz_offsets[ref_timezone])
+    # a file split by ParticleID gives its window to every pod that was in it
+    windows = pd.DataFrame({'pod': [deployment_log.pods(filename) for filename in field_deployment_log['file_name']],
+                            'start': field_deployment_log['start'] - pd.to_timedelta(timezone_change_from_ref, unit='h'),
+                            'end': field_deployment_log['end'] - pd.to_timedelta(timezone_change_from_ref, unit='h'),
+                            'location': field_deployment_log['location']}).explode('pod')
+    windows = windows.dropna(subset=['pod', 'start', 'end']).sort_values('start', kind='mergesort')
+
+    location = np.full(len(Y_field_df), str(), dtype=object)
+    times = Y_field_df['datetime'].to_numpy().astype('datetime64[ns]')
+    pod_windows = {pod: group for pod, group in windows.groupby('pod')}
+    for pod, positions in Y_field_df.groupby('pod').indices.items():
+        if pod not in pod_windows:
+            continue
+        starts = pod_windows[pod]['start'].to_numpy().astype('datetime64[ns]')
+        ends = pod_windows[pod]['end'].to_numpy().astype('datetime64[ns]')
+        # last window with start < datetime, then check datetime < end of that window
+        k = np.searchsorted(starts, times[positions], side='left') - 1
+        inside = (k >= 0) & (times[positions] < ends[np.maximum(k, 0)])
+        location[positions[inside]] = pod_windows[pod]['location'].to_numpy()[k[inside]]
+
+    Y_field_df['location'] = location
+    return Y_field_df
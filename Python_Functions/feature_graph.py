@@ -0,0 +1,71 @@
+import itertools
+import numpy as np
+import pandas as pd
+
+# Derived features that can be listed in settings['preprocess'], declared once for the colocation and the field data.
+# They are added to X in this order: each one can use the pod columns and the features declared before it.
+#   'needs': the columns the feature is made from
+#   'column': name of the new column
+# the figaro ratios are needs[0] / needs[1]
+features = {
+    'add_time_elapsed': {'needs': [], 'column': 'time_elapsed_seconds'},
+    'fig2600_2602_ratio': {'needs': ['Fig2600', 'Fig2602'], 'column': 'fig 2600_2602 ratio'},
+    'fig2600_3_ratio': {'needs': ['Fig2600', 'Fig3'], 'column': 'fig 2600_3 ratio'},
+    'fig3_2602_ratio': {'needs': ['Fig3', 'Fig2602'], 'column': 'fig 3_2602 ratio'},
+    'fig4_2602_ratio': {'needs': ['Fig4', 'Fig2602'], 'column': 'fig 4_2602 ratio'},
+    'fig4_3_ratio': {'needs': ['Fig4', 'Fig3'], 'column': 'fig 4_3 ratio'},
+}
+# 'interaction_terms' always comes last: it multiplies pairs of every column before it (pod columns and the features above)
+
+def plan_features(columns, preprocess, interaction_pairs=None):
+    # list of (new column, feature name, columns it is made from) for the features in preprocess, in the order they are added.
+    # errors here (before anything is computed) if a feature needs a column that is not there
+    available = list(columns)
+    steps = []
+    for name, feature in features.items():
+        if name not in preprocess:
+            continue
+        missing = [column for column in feature['needs'] if column not in available]
+        if missing:
+            raise KeyError(f"{missing} column(s) not found in pod data, so {name} cannot run. Check column_names variable.")
+        steps.append((feature['column'], name, feature['needs']))
+        available.append(feature['column'])
+
+    if 'interaction_terms' in preprocess:
+        # interaction_pairs: the pairs chosen for the colocation model. None uses every pair of columns
+        pairs = list(itertools.combinations(available, 2)) if interaction_pairs is None else interaction_pairs
+        for col1, col2 in pairs:
+            missing = [column for column in (col1, col2) if column not in available]
+            if missing:
+                raise KeyError(f"{missing} column(s) not found in pod data, so interaction_terms cannot run. Check settings['interaction_pairs'].")
+            steps.append((f"{col1}*{col2}", 'interaction_terms', [col1, col2]))
+    return steps
+
+def build_features(data, preprocess, earliest_time=None, interaction_pairs=None, dtype=None):
+    # returns data plus every derived feature in preprocess, computed in one pass into one preallocated block.
+    # the colocation and field scripts both use this, so the field X has exactly the colocation X columns, in the same order
+    steps = plan_features(data.columns, preprocess, interaction_pairs)
+    if dtype is None:
+        dtype = 'float32' if all(data_dtype == np.float32 for data_dtype in data.dtypes) else 'float64'
+
+    n_columns = len(data.columns)
+    block = np.empty((len(data), n_columns + len(steps)), dtype=dtype)
+    block[:, :n_columns] = data.to_numpy(dtype=dtype)
+    position = {column: i for i, column in enumerate(data.columns)}
+
+    for k, (column, name, needs) in enumerate(steps):
+        out = block[:, n_columns + k]
+        if name == 'add_time_elapsed':
+            if earliest_time is None:
+                raise KeyError("add_time_elapsed needs the earliest deployment log start time (settings['earliest_time']).")
+            # seconds since the first time in the deployment log (time elapsed needs to come after time averaging to be accurate)
+            out[:] = (data.index - pd.Timestamp(earliest_time)).total_seconds()
+        elif name == 'interaction_terms':
+            np.multiply(block[:, position[needs[0]]], block[:, position[needs[1]]], out=out)
+        else:
+            # figaro ratios (a zero denominator gives inf, as dividing the columns did before)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                np.divide(block[:, position[needs[0]]], block[:, position[needs[1]]], out=out)
+        position[column] = n_columns + k
+
+    return pd.DataFrame(block, index=data.index, columns=list(data.columns) + [column for column, name, needs in steps])
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import glob
+import joblib
+import numpy as np
+import pandas as pd
+from Python_Functions import pod_schemas
+
+# Per-file cache of parsed raw pod files.
+# Each parsed file is saved next to the data (in a 'pod_cache' folder inside Colocation/Pods, Harmonization or Field)
+# under a key made from the file contents, the header_type and the column names of that header_type.
+# If any of those change, the key changes and the file is parsed again. Nothing else has to be deleted by hand.
+#
+# Two formats are available:
+#   'parquet': compressed columnar file (falls back to a pickle if pyarrow is not installed)
+#   'npy': one float64 array per pod file (first column is the timestamp in seconds) that is memory-mapped when read,
+#          so opening it costs almost nothing and only the columns and rows used are read from disk. A small .json file
+#          next to it holds the column names. All columns are stored as numbers (text becomes NaN).
+
+cache_folder = 'pod_cache'
+
+def file_digest(file_path):
+    # hash the file contents in blocks so large SD card dumps are never fully held in memory
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cache_key(file_path, header_type, columns):
+    key = hashlib.sha1()
+    key.update(file_digest(file_path).encode())
+    key.update(pod_schemas.schema_key(header_type, columns).encode())
+    return key.hexdigest()[:20]
+
+def inputs_key(file_paths, deployment_rows, used_settings):
+    # key of data made from several files: their contents, their deployment log rows and the settings used to read and
+    # preprocess them. editing any file, deployment log row or setting gives a new key
+    key = hashlib.sha1()
+    for file_path in file_paths:
+        key.update(file_digest(file_path).encode())
+    key.update(deployment_rows.to_csv(index=False).encode())
+    key.update(json.dumps(used_settings, sort_keys=True, default=str).encode())
+    return key.hexdigest()[:20]
+
+def load_keyed(file_path, key):
+    # data saved with save_keyed, or None if the file is missing or was saved under another key (so the data is made again)
+    if not os.path.exists(file_path):
+        return None
+    saved = joblib.load(file_path)
+    if not isinstance(saved, dict) or saved.get('key') != key:
+        return None
+    return saved['data']
+
+def save_keyed(data, file_path, key):
+    joblib.dump({'key': key, 'data': data}, file_path)
+
+def cache_files(data_path, file):
+    # all cached versions of a file (the '.' separator keeps APOD1_7 from matching APOD1_7_2)
+    return glob.glob(os.path.join(data_path, cache_folder, f'{glob.escape(file)}.*.*'))
+
+def write_npy(data, file_path):
+    # timestamps (seconds since 1970) go in column 0, then every sensor column. Fortran order keeps each column
+    # contiguous on disk, so reading a few columns out of the memory map only touches those columns.
+    # rows are saved in time order (stable, so repeated timestamps keep their order) so read_npy can crop by slicing
+    data = data.sort_index(kind='mergesort')
+    values = np.empty((len(data), len(data.columns) + 1), dtype='float64', order='F')
+    values[:, 0] = data.index.values.astype('datetime64[ns]').astype('int64') / 1e9
+    for j, column in enumerate(data.columns):
+        values[:, j + 1] = pd.to_numeric(data[column], errors='coerce')
+    np.save(file_path + '.npy', values)
+    with open(file_path + '.json', 'w') as f:
+        json.dump({'columns': list(data.columns)}, f)
+
+def read_npy(file_path, columns=None, start=None, end=None):
+    with open(file_path + '.json') as f:
+        stored_columns = json.load(f)['columns']
+    values = np.load(file_path + '.npy', mmap_mode='r')
+
+    index = pd.DatetimeIndex(pd.to_datetime(np.round(values[:, 0] * 1e6).astype('int64'), unit='us'), name='datetime')
+    # keep start <= time <= end. the rows are in time order, so this is a slice of the memory map (nothing is copied).
+    # copies saved before the rows were sorted are left whole and cropped by load_file
+    if (start is not None or end is not None) and index.is_monotonic_increasing:
+        first = 0 if start is None else index.searchsorted(start, side='left')
+        last = len(index) if end is None else index.searchsorted(end, side='right')
+        values = values[first:last]
+        index = index[first:last]
+
+    # the dataframe columns are views of the memory-mapped block
+    if columns is None:
+        return pd.DataFrame(values[:, 1:], index=index, columns=stored_columns, copy=False)
+
+    positions = [stored_columns.index(column) + 1 for column in columns]
+    return pd.DataFrame({column: values[:, j] for column, j in zip(columns, positions)}, index=index, copy=False)
+
+def stored_format(cache_format, columns):
+    # npy only holds numbers, so files with a text column (the ParticleID of combined cellular exports) use parquet
+    if cache_format == 'npy' and pod_schemas.device_id_column not in columns:
+        return 'npy'
+    return 'parquet'
+
+def read_cache(data_path, file, key, columns=None, cache_format='parquet', start=None, end=None):
+    parquet_path = os.path.join(data_path, cache_folder, f'{file}.{key}.parquet')
+    pickle_path = os.path.join(data_path, cache_folder, f'{file}.{key}.pkl')
+    npy_path = os.path.join(data_path, cache_folder, f'{file}.{key}')
+
+    # only the requested format is read (cache_format from stored_format). a copy in the other format is a miss,
+    # so the file is parsed again and saved in the requested format
+    # columns: only read these columns (parquet only reads those columns from disk)
+    # start, end: npy copies are cropped to this window when they are opened (other formats are cropped by load_file)
+    if cache_format == 'npy':
+        if os.path.exists(npy_path + '.npy') and os.path.exists(npy_path + '.json'):
+            return read_npy(npy_path, columns, start, end)
+        return None
+    if os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path, columns=columns)
+    if os.path.exists(pickle_path):
+        data = pd.read_pickle(pickle_path)
+        return data if columns is None else data[columns]
+    return None
+
+def write_cache(data, data_path, file, key, cache_format='parquet'):
+    os.makedirs(os.path.join(data_path, cache_folder), exist_ok=True)
+
+    # remove old versions of this file (data was edited, header_type changed, etc.)
+    for old_file in cache_files(data_path, file):
+        os.remove(old_file)
+
+    if stored_format(cache_format, data.columns) == 'npy':
+        write_npy(data, os.path.join(data_path, cache_folder, f'{file}.{key}'))
+        return
+
+    # parquet is the fast columnar format. If pyarrow is not installed, or the data has mixed types
+    # (possible when not using fast_parse), fall back to a pickle
+    try:
+        data.to_parquet(os.path.join(data_path, cache_folder, f'{file}.{key}.parquet'))
+    except (ImportError, ValueError, TypeError):
+        parquet_path = os.path.join(data_path, cache_folder, f'{file}.{key}.parquet')
+        if os.path.exists(parquet_path):
+            os.remove(parquet_path)
+        data.to_pickle(os.path.join(data_path, cache_folder, f'{file}.{key}.pkl'))
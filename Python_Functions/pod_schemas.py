@@ -0,0 +1,88 @@
+import hashlib
+import json
+
+# Registry of the pod data file formats (header types).
+# Each header_type in the deployment log "header_type" column maps to the list of column names in its pod files.
+# besides datetime (or date and time), ALL columns must be numeric.
+# To add a new firmware version, add its column list here (or to settings['column_names'] in MPC_colocation.py for a one-off run).
+
+column_names = {'3.1.0': # latest and greatest firmware update
+        ["datetime", "Volts", "Fig2600", "Fig2602", "Fig3", "Fig3heater", "Fig4", "Fig4heater",
+        "PID","Mics2611", "CO_aux","CO_main", "CO2", "Temperature", "Pressure", "Humidity",
+        "Quad1C1", "Quad1C2", "Quad1C3", "Quad1C4", "Quad2C1", "Quad2C2", "Quad2C3", "Quad2C4",
+        "MQ131", "PM 10 ENV", "PM 25 ENV", "PM 100 ENV", "PM 03 um", "PM 05 um", "PM 10 um",
+        "PM 25 um", "PM 50 um", "PM 100 um", "OPC1", "OPC2", "OPC3", "OPC4", "OPC5", "WS_mph", "WD", "unk"],
+
+    '3.1.1': # fixing apods from 9/2024
+        ["datetime", "Volts", "Fig2600", "Fig2602", "Fig3", "Fig3heater", "Fig4", "Fig4heater",
+        "PID","Mics2611", "CO_aux","CO_main", "CO2", "Temperature", "Pressure", "Humidity",
+        "Quad1C1", "Quad1C2", "Quad1C3", "Quad1C4", "Quad2C1", "Quad2C2", "Quad2C3", "Quad2C4",
+        "MQ131", "PM 10 ENV", "PM 25 ENV", "PM 100 ENV", "PM 03 um", "PM 05 um", "PM 10 um",
+        "PM 25 um", "PM 50 um", "PM 100 um", "OPC1", "OPC2", "OPC3", "OPC4", "OPC5", "WS_mph",
+        "WD", "unk1", "unk2", "unk3", "unk4", "unk5", "unk6", "unk7", "unk8", "unk9", "unk10",
+        "unk11", "unk12", "unk13", "unk14", "unk15", "unk16", "unk17"],
+
+    '3.2.0': #MPOD SD card 1/2025
+        ["datetime", "Fig2600", "Fig2602", "Fig2611", "CO_worker", "CO_aux",
+         "Temperature", "Pressure", "Humidity", "Gas_Resistance"],
+
+    '3.2.1': #MPOD cellular 1/2025
+        ["ParticleID","datetime", "Fig2600", "Fig2602", "Fig2611", "CO_aux", "CO_worker",
+         "Temperature", "Humidity"],
+
+    '3.1.2': #for APOD5 with updated firmware (XPODV3.1.2) #need to validate # of unknowns
+        ["datetime", "Volts", "Fig2600", "Fig2602", "Fig3", "Fig3heater", "Fig4", "Fig4heater",
+        "e2V","PID", "CO_aux","CO_main", "CO2", "Temperature", "Pressure", "Humidity",
+        "Quad1C1", "Quad1C2", "Quad2C1", "Quad2C2", "Quad3C1", "Quad3C2", "Quad4C1", "Quad4C2",
+        "MET_spd", "MET_dir", "MQ131", "PM 10 ENV", "PM 25 ENV", "PM 100 ENV", "PM 03 um", "PM 05 um", "PM 10 um",
+        "PM 25 um", "PM 50 um", "PM 100 um"],
+
+    '3.0.9': # for C16 September 2023
+        ["datetime", "Volts", "Fig2600", "Fig2602", "Fig3", "Fig3heater", "Fig4", "Fig4heater",
+        "PID","Mics2611", "CO_main", "CO2", "Temperature", "Pressure", "Humidity",
+        "Quad1C1", "Quad1C2", "Quad1C3", "Quad1C4", "Quad2C1", "Quad2C2", "Quad2C3", "Quad2C4",
+        "MQ131", "PM 10 ENV", "PM 25 ENV", "PM 100 ENV", "PM 03 um", "PM 05 um", "PM 10 um",
+        "PM 25 um", "PM 50 um", "PM 100 um", "OPC1", "OPC2", "OPC3", "OPC4", "OPC5", "WS_mph", "WD", "unk", "unk1", "unk2"],
+
+    '3.0.0':
+        ["datetime", "Volts", "Fig2600", "Fig2602", "Fig3heater", "Fig3", "Fig4heater", "Fig4",
+         "e2vO3", "PID", "CO_aux", "CO_main", "CO2", "Temperature", "Pressure", "Humidity",
+         "QS1_Aux", "QS1_Main", "QS2_Aux", "QS2_Main", "QS3_Aux", "QS3_Main", "QS4_Aux",
+         "QS_Main", "Wind_Dir", "Wind_Spd", "MQ", "PT_PM10ENV", "PT_PM25ENV", "PT_PM100ENV",
+         "PT_PM03um", "PT_PM05um", "PT_PM10um", "PT_PM25um", "PT_PM50um", "PT_100um", "OPC_SampPer",
+         "OPC_FlowRate", "OPC_PM10", "OPC_PM25", "OPC_PM100"],
+
+    '3.1.2_opc':
+        ["datetime", "Volts", "Fig2600", "Fig2602", "Fig3", "Fig3heater", "Fig4", "Fig4heater",
+         "PID","Mics2611", "CO_aux", "CO_main", "CO2",
+         "Temperature", "Pressure", "Humidity", "QS1_Aux", "QS1_Main", "QS2_Aux", "QS2_Main",
+         "QS3_Aux", "QS3_Main", "QS4_Aux", "QS4_Main", 'WS_mph', 'WD',
+         "MQ131", "PM 10 ENV", "PM 25 ENV", "PM 100 ENV", "PM 03 um", "PM 05 um", "PM 10 um",
+         "PM 25 um", "PM 50 um", "PM 100 um", 'OPC_Bin1_', 'OPC_Bin2', 'OPC_Bin3', 'OPC_Bin4',
+         'OPC_Bin5', 'OPC_Bin6', 'OPC_Bin7', 'OPC_Bin8',
+         'OPC_Bin9', 'OPC_Bin10', 'OPC_Bin11', 'OPC_Bin12', 'OPC_Bin13', 'OPC_Bin14',
+         'OPC_Bin15', 'OPC_Bin16', 'OPC_SampPer',
+         'OPC_FlowRate', 'OPC_PM10_', 'OPC_PM25', 'OPC_PM100', 'unk'],
+
+    '3.1.2_not using':
+        ["datetime","Volts", "Fig2600", "Fig2602","Fig3","Fig3heater", "Fig4","Fig4heater",
+        "PID", "Mics2611", "CO_aux","CO_main", "CO2", "Temperature", "Pressure", "Humidity", "Quad1C1", "Quad1C2","Quad1C3","Quad1C4",
+        "Quad2C1", "Quad2C2","Quad2C3","Quad2C4",'WS_mph','WD',
+        "MQ131","PM 10 ENV", "PM 25 ENV", "PM 100 ENV", "PM 03 um", "PM 05 um", "PM 10 um",
+        "PM 25 um", "PM 50 um", "PM 100 um",'OPC1','OPC2','OPC3','OPC4','OPC5', 'unk']
+}
+
+# columns that hold the timestamp instead of sensor data
+datetime_column_names = ['datetime', 'date', 'time']
+
+# column that holds the device (particle) id in combined cellular exports. Files with this column can hold several
+# pods and are split by it when loaded (see load_particle_ids in data_loading_func.py for the id to pod name table)
+device_id_column = 'ParticleID'
+
+def numeric_columns(columns):
+    # the sensor columns of a pod file (everything except the timestamp and the device id), which are read as numbers
+    return [column for column in columns if column not in datetime_column_names and column != device_id_column]
+
+def schema_key(header_type, columns):
+    # short fingerprint of a header type's columns, used to tell when saved (cached) pod files no longer match the schema
+    return hashlib.sha1(json.dumps([header_type, list(columns)]).encode()).hexdigest()[:12]
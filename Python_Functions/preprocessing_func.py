@@ -5,9 +5,8 @@ Created on Tue Dec 19 14:33:19 2023
 @author: cfris
 """
 import pandas as pd
-from atmos import calculate
-from sklearn.preprocessing import PolynomialFeatures
 import numpy as np
+import itertools
 
 def temp_C_2_K(data):
     #convert temp from celsius to kelvin
@@ -18,46 +17,48 @@ def temp_C_2_K(data):
     data["Temperature"]=data["Temperature"]+273.15
     return data
 
-def rmv_warmup(data, t_warmup):
+def rmv_warmup(data, t_warmup, return_removed=False):
+    # data must be in time order (preprocessing_func sorts it first)
+    warmup = pd.Timedelta(minutes=t_warmup)
     # remove the first warm up period
-    initial_warmup_rows = data.index < (data.index[0] + pd.Timedelta(minutes=t_warmup))
+    removed = [(data.index[0], data.index[0] + warmup)]
+    initial_warmup_rows = data.index < (data.index[0] + warmup)
     data = data[~initial_warmup_rows]
     # remove an additional warm up period after anytime pod turns off
     time_diff = data.index.to_series().diff()
     median_timestep = time_diff.median()  # finding median time step
     rows_to_remove = time_diff > 10 * median_timestep  # identifying rows where the time gap is 10 times longer than the median time gap between samples (pod was likely turned off)
 
-    # the following lines identify rows where the pod likely turned off, and then remove a warm up period length of time after it turned off
-    indices_to_remove = set()
-    for i, remove in enumerate(rows_to_remove):
-        if remove:
-            indices_to_remove.add(data.index[
-                                      i])  # if the row is one that has a greater time diff, it is added to the list of what should be removed
-            for j in range(i + 1, len(rows_to_remove)):
-                if data.index[j] - data.index[i] > pd.Timedelta(
-                        minutes=t_warmup):  # if the next row is less than the total warm up time, it should also be removed. here, this inner loop breaks if the time is past the warm up period
-                    break
-                indices_to_remove.add(data.index[j])
-
-    data = data.drop(index=list(indices_to_remove))
+    # a row is in a warm up period if it is at most t_warmup after the last row where the pod turned back on.
+    # the last turn on time before each row is found with a binary search instead of looping over the rows after every gap
+    times = data.index.to_numpy()
+    gap_times = times[rows_to_remove.to_numpy()]
+    if len(gap_times) == 0:
+        in_warmup = np.zeros(len(data), dtype=bool)
+    else:
+        last_gap = np.searchsorted(gap_times, times, side='right') - 1
+        in_warmup = (last_gap >= 0) & (times - gap_times[np.maximum(last_gap, 0)] <= warmup.to_timedelta64())
+    removed += [(gap_time, gap_time + warmup) for gap_time in data.index[rows_to_remove.to_numpy()]]
+
+    data = data[~in_warmup]
+    if return_removed:
+        # (start, end) of every warm up period that was removed, for checking what was dropped
+        return data, removed
     return data
 
-def interaction_terms(data):
-    #create columns of interaction terms that are a each 2-sensor combination multiplied together
-    #for CO, temp, humidity sensor, it would be CO*temp, CO*humidity, temp*humidity
-    poly = PolynomialFeatures(degree=2,interaction_only=True, include_bias=False)
-    data_transformed = poly.fit_transform(data)
-    data_transformed_df = pd.DataFrame(data_transformed)
-    original_columns = data.columns.tolist()
-    interaction_columns = []
-    for i, col1 in enumerate(original_columns):
-        for j, col2 in enumerate(original_columns[i + 1:]):
-            interaction_columns.append(f"{col1}*{col2}")
-
-        # Rename the columns of the DataFrame
-    data_transformed_df.columns = original_columns + interaction_columns
-
-    return data_transformed_df
+def select_interaction_pairs(data, y, max_pairs):
+    #pick the max_pairs 2-sensor combinations whose product has the highest correlation (positive or negative) with y.
+    #returns the pairs in the same order feature_graph.build_features makes the interaction terms
+    pairs = list(itertools.combinations(data.columns.tolist(), 2))
+    y_values = np.asarray(y, dtype=np.float64)
+    y_values = (y_values - y_values.mean()) / y_values.std()
+    correlation = np.zeros(len(pairs))
+    for k, (col1, col2) in enumerate(pairs):
+        product = data[col1].to_numpy(dtype=np.float64) * data[col2].to_numpy(dtype=np.float64)
+        if product.std() > 0:
+            correlation[k] = np.mean((product - product.mean()) / product.std() * y_values)
+    keep = np.sort(np.argsort(-np.abs(np.nan_to_num(correlation)), kind='stable')[:max_pairs])
+    return [pairs[k] for k in keep]
 
 def hum_rel_2_abs(data):
     if 'Humidity' not in data.columns:
@@ -68,11 +69,21 @@ def hum_rel_2_abs(data):
         raise KeyError(
             "'Pressure' column not found in pod data, so hum_rel_2_abs cannot run. Check column_names variable.")
 
-    # convert humidity from relative to absolute using the atmos package
-    AH = calculate('AH', RH=data["Humidity"], p=data["Pressure"] * 100, T=data["Temperature"], debug=True)
-    data["Humidity"] = AH[0]
+    # convert humidity from relative to absolute (pressure in hPa, temperature in K)
+    data["Humidity"] = absolute_humidity(data["Humidity"].to_numpy(), data["Pressure"].to_numpy() * 100, data["Temperature"].to_numpy())
     return data
 
+def absolute_humidity(RH, p, T):
+    # absolute humidity (kg/m3) from relative humidity (%), pressure (Pa) and temperature (K).
+    # same equations the atmos package used for calculate('AH', RH=..., p=..., T=...), written with numpy arrays
+    es = 611.2 * np.exp(17.67 * (T - 273.15) / (T - 29.65))  # saturation vapor pressure (Bolton 1980)
+    rvs = 0.622 * es / (p - es)  # saturation mixing ratio
+    rv = RH / 100. * rvs  # mixing ratio
+    qv = rv / (1. + rv)  # specific humidity
+    Tv = T * (1 + rv / 0.622) / (1 + rv)  # virtual temperature
+    rho = p / (287.04 * Tv)  # air density (ideal gas, R for dry air)
+    return qv * rho
+
 def add_time_elapsed(data, earliest_time):
     # Create a new column for time elapsed since the first time index
     data['time_elapsed'] = data.index - earliest_time
@@ -81,79 +92,44 @@ def add_time_elapsed(data, earliest_time):
     data = data.drop('time_elapsed',axis=1)
     return data
 
-def fig2600_2602_ratio(data):
-    if 'Fig2600' not in data.columns or 'Fig2602' not in data.columns:
-        raise KeyError(
-            "'Fig2600' AND/OR 'Fig2602' column(s) not found in pod data, so fig_ratio cannot run. Check column_names variable.")
-
-    data['fig 2600_2602 ratio'] = data['Fig2600'] / data['Fig2602']
-    return data
-
-def fig3_2602_ratio(data):
-    if 'Fig3' not in data.columns or 'Fig2602' not in data.columns:
-        raise KeyError(
-            "'Fig3' AND/OR 'Fig2602' column(s) not found in pod data, so fig_ratio cannot run. Check column_names variable.")
-
-    data['fig 3_2602 ratio'] = data['Fig3'] / data['Fig2602']
-    return data
-
-def fig4_2602_ratio(data):
-    if 'Fig4' not in data.columns or 'Fig2602' not in data.columns:
-        raise KeyError(
-            "'Fig4' AND/OR 'Fig2602' column(s) not found in pod data, so fig_ratio cannot run. Check column_names variable.")
-
-    data['fig 4_2602 ratio'] = data['Fig4'] / data['Fig2602']
-    return data
-
-def fig4_3_ratio(data):
-    if 'Fig3' not in data.columns or 'Fig4' not in data.columns:
-        raise KeyError(
-            "'Fig3' AND/OR 'Fig4' column(s) not found in pod data, so fig_ratio cannot run. Check column_names variable.")
-
-    data['fig 4_3 ratio'] = data['Fig4'] / data['Fig3']
-    return data
-
-def fig2600_3_ratio(data):
-    if 'Fig2600' not in data.columns or 'Fig3' not in data.columns:
-        raise KeyError(
-            "'Fig2600' AND/OR 'Fig3' column(s) not found in pod data, so fig_ratio cannot run. Check column_names variable.")
+def stratified_resample(X_train, y_train, edges, n_keep, seed=None):
+    # bins y_train with one pass over the data: bin i holds edges[i] <= y < edges[i+1] (values outside the edges are kept).
+    # n_keep is the number of samples to keep in each bin. bins with more samples keep a random selection of n_keep of them
+    # returns the kept rows of X_train and y_train in their original order, so X and y stay aligned
+    y_values = np.asarray(y_train)
+    strata = np.digitize(y_values, edges) - 1
+    rng = np.random.default_rng(seed)
+
+    # rows of each bin, from one stable sort of the bin numbers
+    order = np.argsort(strata, kind='stable')
+    bin_starts = np.searchsorted(strata[order], np.arange(len(edges)))
+
+    keep = np.ones(len(y_values), dtype=bool)
+    for i in range(len(edges) - 1):
+        bin_indices = order[bin_starts[i]:bin_starts[i + 1]]
+        if len(bin_indices) > n_keep[i]:
+            # If more samples in the bin than the target, randomly select samples
+            keep[bin_indices] = False
+            keep[rng.choice(bin_indices, size=n_keep[i], replace=False)] = True
 
-    data['fig 2600_3 ratio'] = data['Fig2600'] / data['Fig3']
-    return data
+    kept = np.flatnonzero(keep)
+    X_selected = X_train.iloc[kept] if hasattr(X_train, 'iloc') else X_train[kept]
+    y_selected = y_train.iloc[kept] if hasattr(y_train, 'iloc') else y_train[kept]
+    return X_selected, y_selected
 
-def binned_resample(X_train, y_train, n_bins, target_bin_multiplier ):
-    downsampled_series_list = []
+def binned_resample(X_train, y_train, n_bins, target_bin_multiplier, seed=None):
     # Run on reference data.
     bins, edges = np.histogram(y_train, bins=n_bins, density=False)
+    # the last bin includes the largest value
+    edges[-1] = np.inf
 
     # Determine the desired number of samples per bin
     target_samples_per_bin = round(target_bin_multiplier * len(y_train) // n_bins)
 
     # Downsampling to ensure the same number of samples in each bin
-    rows_to_remove = []
-    for i in range(n_bins):
-        bin_indices = np.where((y_train >= edges[i]) & (y_train <= edges[i + 1]))[0]
-        if len(bin_indices) > target_samples_per_bin:
-            # If more samples in the bin than the target, randomly select samples
-            selected_indices = np.random.choice(bin_indices, size=target_samples_per_bin, replace=False)
-            selected_values = y_train.iloc[selected_indices]
-            downsampled_series_list.append(selected_values)
-            # Save indices to remove from the DataFrame
-            rows_to_remove.extend(bin_indices[~np.isin(bin_indices, selected_indices)])
-        else:
-            # If fewer samples, include all samples in the bin
-            downsampled_series_list.append(y_train.iloc[bin_indices])
-
-    # Concatenate the downsampled Series into a single Series
-    y_selected = pd.concat(downsampled_series_list) #y selected is shuffled!
-    y_selected = y_selected.sort_index()
-    # Remove rows from df_to_remove based on the indices removed during downsampling
-    #X_selected = X_train.drop(index=X_train.index[rows_to_remove])
-    X_selected = np.delete(X_train, rows_to_remove, axis=0) #X selected is not!!! this is causing model fit problems.
-
-    return X_selected, y_selected
+    return stratified_resample(X_train, y_train, edges, [target_samples_per_bin] * n_bins, seed)
 
-def resample_quartile(X_train, y_train, quartile, downsampling_rate):
+def resample_quartile(X_train, y_train, quartile, downsampling_rate, seed=None):
 
     quartiles = pd.DataFrame({'Lower':[0, 0.25, 0.5, 0.75],
                               'Upper': [0.25, 0.5, 0.75, 1]},
@@ -161,31 +137,43 @@ def resample_quartile(X_train, y_train, quartile, downsampling_rate):
 
     upper_edge = y_train.quantile(quartiles['Upper'].loc[quartile])
     lower_edge = y_train.quantile(quartiles['Lower'].loc[quartile])
-    quartile_filter = (y_train < upper_edge) & (y_train >= lower_edge)
-
-    quartile_indices = y_train[quartile_filter].index
+    quartile_count = int(((y_train < upper_edge) & (y_train >= lower_edge)).sum())
 
-    # Calculate the number of instances to keep
-    num_instances_to_remove = int(len(quartile_indices) * (1-downsampling_rate))
+    # Calculate the number of instances to keep (the other quartiles are left as they are)
+    num_instances_to_remove = int(quartile_count * (1-downsampling_rate))
 
     # Randomly sample instances to keep
-    removed_quartile_indices = np.random.choice(quartile_indices, size=num_instances_to_remove,
-                                                          replace=False)
-
-    # Create the downsampled dataset
-    y_selected = y_train.drop(index=removed_quartile_indices)
-    X_selected = X_train.drop(index=removed_quartile_indices)
-
-    return X_selected, y_selected
-    # Now, 'downsampled_df' represents the dataset with downsampled lower quartile values
-
-def preprocessing_func(data, sensors_included, t_warmup, preprocess):
-     #change 999 to NA
-     data.replace(999, pd.NA, inplace=True)
-
-     #make sure all columns are numeric to avoid errors later:
-     for col in data:
-         data[col] = pd.to_numeric(data[col], errors='coerce').astype(float)
+    return stratified_resample(X_train, y_train, [lower_edge, upper_edge], [quartile_count - num_instances_to_remove], seed)
+
+# the preprocess steps that preprocessing_func applies to the pod data (before time averaging).
+# the other steps (features and resampling) run on X and y after time averaging
+pod_data_steps = ["temp_C_2_K", "hum_rel_2_abs", "rmv_warmup", "rmv_negative_CO_aux"]
+
+def required_columns(sensors_included, preprocess):
+    # the pod data columns that preprocessing_func needs: the included sensors, plus the columns used by the
+    # temperature and humidity conversions. load_data only has to read these columns from the pod files
+    columns = list(sensors_included)
+    if "temp_C_2_K" in preprocess:
+        columns += ['Temperature']
+    if "hum_rel_2_abs" in preprocess:
+        columns += ['Temperature', 'Pressure', 'Humidity']
+    return list(dict.fromkeys(columns))
+
+def clean_numeric(data, columns, dtype='float64'):
+    # keep only the columns that are used, make sure they are numeric (anything else becomes NaN) and change 999 to NaN.
+    # the columns are put in one float block so the 999 check is a single vectorized step over all of them
+    data = data[columns]
+    text_columns = [column for column in columns if not pd.api.types.is_numeric_dtype(data[column])]
+    if text_columns:
+        data = data.assign(**{column: pd.to_numeric(data[column], errors='coerce') for column in text_columns})
+    values = data.to_numpy(dtype=dtype, copy=True)
+    values[values == 999] = np.nan
+    return pd.DataFrame(values, index=data.index, columns=columns)
+
+def preprocessing_func(data, sensors_included, t_warmup, preprocess, dtype='float64'):
+     #remove unused columns, change 999 to NA and make sure all columns are numeric to avoid errors later
+     #(missing columns are left out here so the checks below can say which step needed them)
+     data = clean_numeric(data, [column for column in required_columns(sensors_included, preprocess) if column in data.columns], dtype)
     
      #apply preprocess (rmv 999 and NaN, rmv warm up, humid and temp conversion)
      #scaling happens in the ML section instead of the preprocess section here BECAUSE WE WANT TO SCALE ONLY THE TRAINING DATA
@@ -220,4 +208,8 @@ def preprocessing_func(data, sensors_included, t_warmup, preprocess):
      
      # Drop rows with NaN values
      data.dropna(inplace=True)
+
+     #the humidity conversion returns float64, so put everything back in the requested precision
+     if (data.dtypes != dtype).any():
+         data = data.astype(dtype)
      return data
\ No newline at end of file
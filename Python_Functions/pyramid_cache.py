@@ -0,0 +1,94 @@
+import os
+import pandas as pd
+from Python_Functions import pod_cache
+from Python_Functions import preprocessing_func
+from Python_Functions import retiming_func
+
+# Cache of the time averaged colocation data (preprocessed pod data and reference data, aligned) at several intervals.
+# The first run with a set of colocation files builds every level of the pyramid at once. Later runs with the same
+# files and preprocessing, at any of these intervals, read their level instead of loading and preprocessing again,
+# so a time_interval sweep only costs the model fitting.
+# Each level is averaged from the preprocessed data itself (a median of 5 min medians is not the 15 min median).
+#
+# Levels are saved in Colocation/pyramid_cache under a key made from the contents of the pod and reference files,
+# the colocation rows of the deployment log and the settings used before time averaging. If any of those change,
+# the key changes and the pyramid is built again. The folder can be deleted at any time.
+
+pyramid_folder = os.path.join('Colocation', 'pyramid_cache')
+pyramid_levels = [1, 5, 15, 60]  # minutes. time_interval is always added as a level too
+
+def level_name(time_interval):
+    # '60' and 60.0 both give '60min'
+    return f'{float(time_interval):g}min'
+
+def level_path(key, time_interval, stats=False):
+    return os.path.join(pyramid_folder, f'{key}.{level_name(time_interval)}' + ('.stats' if stats else ''))
+
+def pyramid_key(file_paths, deployment_rows, settings):
+    # file_paths: the colocation pod files and the reference file
+    # deployment_rows: deployment log rows of the colocation files (start, end, timezone and header_type crop and correct the data)
+    # the key also covers the settings used before time averaging. the feature and resampling steps in preprocess run afterwards,
+    # so changing them (or the models) still uses the same pyramid
+    pod_steps = [step for step in settings['preprocess'] if step in preprocessing_func.pod_data_steps]
+    used_settings = {
+        'pollutant': settings['pollutant'],
+        'ref_timezone': settings['ref_timezone'],
+        'sensors_included': settings['sensors_included'],
+        'preprocess': pod_steps,
+        't_warmup': settings['t_warmup'] if 'rmv_warmup' in pod_steps else None,
+        'column_names': {header_type: settings['column_names'][header_type]
+                         for header_type in sorted(set(deployment_rows['header_type'])) if header_type in settings['column_names']},
+        'precision': settings['precision'],
+        'retime_calc': settings['retime_calc'],
+        'retime_stats': list(settings['retime_stats']),
+        'alignment': settings['alignment'],
+        'asof_tolerance': settings['asof_tolerance'] if settings['alignment'] == 'asof' else None,
+        'clock_offset': settings['clock_offset'],
+    }
+    return pod_cache.inputs_key(file_paths, deployment_rows, used_settings)
+
+def write_frame(data, path):
+    # parquet, or a pickle if pyarrow is not installed (same as pod_cache)
+    try:
+        data.to_parquet(path + '.parquet')
+    except (ImportError, ValueError, TypeError):
+        if os.path.exists(path + '.parquet'):
+            os.remove(path + '.parquet')
+        data.to_pickle(path + '.pkl')
+
+def read_frame(path):
+    if os.path.exists(path + '.parquet'):
+        return pd.read_parquet(path + '.parquet')
+    if os.path.exists(path + '.pkl'):
+        return pd.read_pickle(path + '.pkl')
+    return None
+
+def read_level(key, time_interval, stats=None):
+    # returns (data_combined, retime stats or None), or (None, None) if this level has not been built
+    data_combined = read_frame(level_path(key, time_interval))
+    if data_combined is None:
+        return None, None
+    if not stats:
+        return data_combined, None
+    retime_stats = read_frame(level_path(key, time_interval, stats=True))
+    if retime_stats is None:
+        return None, None
+    return data_combined, retime_stats
+
+def build_pyramid(key, frames, time_interval, retime_calc, stats=None):
+    # time average the frames (pod and reference data, or the as-of pairs) at every level (plus time_interval),
+    # save them, and return the time_interval level
+    os.makedirs(pyramid_folder, exist_ok=True)
+    levels = list(dict.fromkeys([float(level) for level in pyramid_levels] + [float(time_interval)]))
+
+    requested = (None, None)
+    for level in levels:
+        if stats:
+            data_combined, retime_stats = retiming_func.retime(frames, level, retime_calc, stats)
+            write_frame(retime_stats, level_path(key, level, stats=True))
+        else:
+            data_combined, retime_stats = retiming_func.retime(frames, level, retime_calc), None
+        write_frame(data_combined, level_path(key, level))
+        if level == float(time_interval):
+            requested = (data_combined, retime_stats)
+    return requested
@@ -0,0 +1,62 @@
+import pandas as pd
+
+def retime(frames, time_interval, retime_calc='median', stats=None):
+    # time average and align a list of dataframes/series with a datetime index, returned as one dataframe.
+    # same result as pd.concat(frames, axis=1).resample(time_interval + 'min').median() (or mean) followed by dropna(),
+    # but only the intervals that have data are grouped, so long gaps between deployments do not make empty rows.
+    # stats: optional list of extra statistics per interval ('count', 'std'). If given, a second dataframe is returned
+    # with a '<column>_<stat>' column for each, for the same intervals
+    if retime_calc not in ['median', 'mean']:
+        raise KeyError(f"Invalid retime_calc {retime_calc}. Options are median and mean.")
+
+    frames = [frame.to_frame() if isinstance(frame, pd.Series) else frame for frame in frames]
+    interval_length = pd.Timedelta(minutes=float(time_interval))
+
+    if all(frame.empty for frame in frames):
+        combined = pd.concat(frames, axis=1).iloc[:0]
+        return (combined, combined.copy()) if stats else combined
+
+    # intervals start at midnight of the first day with data (like resample does), then every interval_length
+    origin = min(frame.index.min() for frame in frames if not frame.empty).normalize()
+
+    averaged = []
+    interval_stats = []
+    for frame in frames:
+        # interval number of each row. grouping by it only visits the intervals that have rows
+        intervals = ((frame.index - origin) // interval_length).to_numpy()
+        grouped = frame.groupby(intervals)
+        if stats:
+            # all the statistics in one pass over the groups
+            result = grouped.agg([retime_calc] + list(stats))
+            averaged.append(result.xs(retime_calc, axis=1, level=1))
+            result = result.drop(columns=retime_calc, level=1)
+            result.columns = [f'{column}_{stat}' for column, stat in result.columns]
+            interval_stats.append(result)
+        else:
+            averaged.append(grouped.agg(retime_calc))
+
+    # only intervals with data in every column are kept (what dropna did after resampling)
+    combined = pd.concat(averaged, axis=1, join='inner').dropna()
+    combined.index = pd.DatetimeIndex(origin + combined.index * interval_length, name=frames[0].index.name)
+
+    if stats:
+        combined_stats = pd.concat(interval_stats, axis=1, join='inner').loc[(combined.index - origin) // interval_length]
+        combined_stats.index = combined.index
+        return combined, combined_stats
+    return combined
+
+def align_asof(pod_data, ref_data, tolerance):
+    # pair each reference sample with the nearest pod sample (at most tolerance seconds away) before time averaging.
+    # both sides are sorted and joined in one pass, so there is no combined index of every pod and reference time.
+    # returns one row per paired reference time (pod columns, then the reference column), reference samples without a
+    # pod sample close enough are dropped
+    pod_data = pod_data.to_frame() if isinstance(pod_data, pd.Series) else pod_data
+    ref_data = ref_data.to_frame() if isinstance(ref_data, pd.Series) else ref_data
+
+    # merge_asof needs sorted keys of the same time resolution
+    pod_data = pod_data.set_axis(pod_data.index.as_unit('ns')).sort_index()
+    ref_data = ref_data.set_axis(ref_data.index.as_unit('ns')).sort_index()
+
+    paired = pd.merge_asof(ref_data, pod_data, left_index=True, right_index=True, direction='nearest',
+                           tolerance=pd.Timedelta(seconds=float(tolerance)))
+    return paired[list(pod_data.columns) + list(ref_data.columns)].dropna()
@@ -1,9 +1,7 @@
-import csv
+from Python_Functions.dataFormatter.normalizeDates import normalize_file
 
+# copies the csv file to a txt file, normalizing the dates on the way (see Python_Functions/dataFormatter/normalizeDates.py)
+# the pod csv files have month/day/year dates (load_data reads them the same way)
 csv_file = r'APODD8_1029_1104_24.csv'
 txt_file = r'APODD8_1029_1104_24.txt'
-with open(txt_file, "w") as my_output_file:
-    with open(csv_file, "r") as my_input_file:
-        reader = csv.reader(my_input_file)
-        for row in reader:
-            my_output_file.write(','.join(row) + '\n')
\ No newline at end of file
+normalize_file(csv_file, txt_file, dayfirst=False)